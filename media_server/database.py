@@ -1,12 +1,52 @@
 import sqlite3
 import os
+import queue
 import threading
-from typing import Dict, Optional, List, Any, Tuple
+from typing import Dict, Iterator, Optional, List, Any, Tuple
 from absl import logging
 
 DATABASE_NAME = "media_cache.sqlite3"
+# Columns added after the original schema, as (name, type). init_db adds any
+# that are missing so existing databases keep working.
+MIGRATED_COLUMNS = [
+    ("hash_algo", "TEXT"),
+    ("hash_mode", "TEXT"),
+]
 # Use a thread-local storage for database connections
 thread_local = threading.local()
+# Idle connections handed back by release_db_connection, keyed by database
+# path. Request threads are short-lived, so without this every request would
+# open (and set up) a new connection.
+CONNECTION_POOL_SIZE = 8
+_idle_connections: Dict[str, "queue.LifoQueue[sqlite3.Connection]"] = {}
+_idle_connections_lock = threading.Lock()
+# Bumped after every write to media_files, so callers can tell cheaply that
+# the table changed in this process. File sizes and mtimes alone miss writes
+# that reuse WAL frames or land within the filesystem's timestamp granularity.
+_media_generation = 0
+_media_generation_lock = threading.Lock()
+# Applied once to each new connection. WAL lets readers proceed while the
+# scanner writes; synchronous=NORMAL is durable across application crashes in
+# WAL mode and avoids an fsync per commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def get_media_generation() -> int:
+    """Returns a counter that changes after every write to media_files."""
+    return _media_generation
+
+
+def _bump_media_generation() -> None:
+    """Records that media_files may have changed."""
+    global _media_generation
+    with _media_generation_lock:
+        _media_generation += 1
 
 
 def get_db_path(storage_dir: Optional[str] = None) -> str:
@@ -66,31 +106,98 @@ def get_db_connection(db_path: str) -> sqlite3.Connection:
         or thread_local.db_path_for_current_thread != db_path
     ):
 
-        logging.info(
-            f"Creating new SQLite connection for thread {threading.get_ident()} to {db_path}"
+        # Connections move between threads through the idle pool, but each is
+        # only ever used by the one thread that currently holds it, hence
+        # check_same_thread=False in _open_connection.
+        thread_local.connection = _take_idle_connection(db_path) or _open_connection(
+            db_path
         )
-        # Ensure the directory for the database exists before connecting
-        db_dir = os.path.dirname(db_path)
-        if (
-            db_dir
-        ):  # Check if db_dir is not empty (i.e., not just a filename in current dir)
-            os.makedirs(db_dir, exist_ok=True)
-
-        # Using check_same_thread=False can be risky if connections are shared across threads
-        # without external serialization. However, thread_local aims to give each thread its own connection.
-        # If using a true connection pool, check_same_thread might be False, but pool handles safety.
-        # For direct thread_local usage, check_same_thread=True is safer if each thread strictly owns its conn.
-        # Let's assume for now that db_utils is the sole manager of these thread-local conns.
-        # If a conn object from thread_local is passed to another thread, issues can occur.
-        # Sticking to `check_same_thread=False` as per original plan, but with caution.
-        thread_local.connection = sqlite3.connect(db_path, check_same_thread=False)
-        thread_local.connection.row_factory = sqlite3.Row  # Access columns by name
         thread_local.db_path_for_current_thread = (
             db_path  # Store the path for which this connection was made
         )
     return thread_local.connection
 
 
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Opens and configures a new connection to the database.
+
+    Args:
+        db_path: The absolute path to the database file.
+
+    Returns:
+        A new sqlite3.Connection object.
+    """
+    logging.info(
+        f"Creating new SQLite connection for thread {threading.get_ident()} to {db_path}"
+    )
+    # Ensure the directory for the database exists before connecting
+    db_dir = os.path.dirname(db_path)
+    if db_dir:  # Check if db_dir is not empty (i.e., not just a filename in current dir)
+        os.makedirs(db_dir, exist_ok=True)
+
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row  # Access columns by name
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _take_idle_connection(db_path: str) -> Optional[sqlite3.Connection]:
+    """
+    Returns an idle pooled connection to `db_path`, or None if there is none.
+    """
+    with _idle_connections_lock:
+        idle = _idle_connections.get(db_path)
+    if idle is None:
+        return None
+    try:
+        return idle.get_nowait()
+    except queue.Empty:
+        return None
+
+
+def release_db_connection() -> None:
+    """
+    Hands the current thread's connection back to the idle pool.
+
+    The next thread that asks for a connection to the same database reuses
+    it instead of opening a new one. If the pool is full, the connection is
+    closed instead.
+    """
+    conn = getattr(thread_local, "connection", None)
+    if conn is None:
+        return
+    db_path = thread_local.db_path_for_current_thread
+    del thread_local.connection
+    del thread_local.db_path_for_current_thread
+    if conn.in_transaction:
+        conn.rollback()
+    with _idle_connections_lock:
+        idle = _idle_connections.setdefault(
+            db_path, queue.LifoQueue(CONNECTION_POOL_SIZE)
+        )
+    try:
+        idle.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_idle_connections() -> None:
+    """
+    Closes every pooled idle connection.
+    """
+    with _idle_connections_lock:
+        pools = list(_idle_connections.values())
+        _idle_connections.clear()
+    for idle in pools:
+        while True:
+            try:
+                idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
 def close_db_connection() -> None:
     """
     Closes the database connection for the current thread.
@@ -157,16 +264,41 @@ def init_db(storage_dir: str) -> None:
                     mime_type TEXT,
                     filesize INTEGER,
                     tags TEXT,
-                    tagging_model TEXT
+                    tagging_model TEXT,
+                    hash_algo TEXT,
+                    hash_mode TEXT
                 )
             """
             )
+            existing_columns = {
+                row["name"] for row in cursor.execute("PRAGMA table_info(media_files)")
+            }
+            for column, column_type in MIGRATED_COLUMNS:
+                if column not in existing_columns:
+                    logging.info(f"Adding missing column {column} to media_files")
+                    cursor.execute(
+                        f"ALTER TABLE media_files ADD COLUMN {column} {column_type}"
+                    )
             cursor.execute(
                 "CREATE INDEX IF NOT EXISTS idx_file_path ON media_files (file_path)"
             )
             cursor.execute(
                 "CREATE INDEX IF NOT EXISTS idx_last_modified ON media_files (last_modified)"
             )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_creation_date_sha ON media_files (original_creation_date, sha256_hex)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_filesize ON media_files (filesize)"
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS dir_index (
+                    rel_path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """
+            )
             logging.info(
                 f"Database initialized and media_files table ensured at {db_path}"
             )
@@ -177,6 +309,45 @@ def init_db(storage_dir: str) -> None:
         conn.close()
 
 
+MEDIA_FILE_COLUMNS = [
+    "sha256_hex",
+    "filename",
+    "original_filename",
+    "file_path",
+    "last_modified",
+    "original_creation_date",
+    "thumbnail_file",
+    "width",
+    "height",
+    "latitude",
+    "longitude",
+    "city",
+    "country",
+    "mime_type",
+    "filesize",
+    "tags",
+    "tagging_model",
+    "hash_algo",
+    "hash_mode",
+]
+
+
+def _check_required_fields(media_data: Dict[str, Any]) -> None:
+    """
+    Checks that a media record has the fields needed to store it.
+
+    Raises:
+        ValueError: If a required field is missing or None.
+    """
+    required_fields = ["sha256_hex", "filename", "file_path", "last_modified"]
+    for field in required_fields:
+        if field not in media_data or media_data[field] is None:
+            logging.error(
+                f"Required field {field} missing or None in media_data for add_or_update. Data: {media_data}"
+            )
+            raise ValueError(f"Required field {field} missing or None in media_data")
+
+
 def add_or_update_media_file(db_path: str, media_data: Dict[str, Any]) -> None:
     """
     Adds a new media file record to the database or updates an existing one.
@@ -189,62 +360,57 @@ def add_or_update_media_file(db_path: str, media_data: Dict[str, Any]) -> None:
         db_path: The path to the database file.
         media_data: A dictionary containing the media file's metadata.
     """
+    add_or_update_media_files(db_path, [media_data])
+
+
+def add_or_update_media_files(
+    db_path: str, media_data_list: List[Dict[str, Any]]
+) -> None:
+    """
+    Adds or updates several media file records in a single transaction.
+
+    Records are written as by `add_or_update_media_file`, but with one
+    `executemany` per statement and a single commit (and sync to disk), which
+    makes large scans much cheaper to persist. If any record fails, none of
+    the batch is written.
+
+    Args:
+        db_path: The path to the database file.
+        media_data_list: A list of dictionaries containing media metadata.
+    """
+    if not media_data_list:
+        return
+    for media_data in media_data_list:
+        _check_required_fields(media_data)
     conn = get_db_connection(db_path)
-    required_fields = ["sha256_hex", "filename", "file_path", "last_modified"]
-    for field in required_fields:
-        if field not in media_data or media_data[field] is None:
-            logging.error(
-                f"Required field {field} missing or None in media_data for add_or_update. Data: {media_data}"
-            )
-            raise ValueError(f"Required field {field} missing or None in media_data")
     try:
         with conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT sha256_hex FROM media_files WHERE file_path = ? AND sha256_hex != ?",
-                (media_data["file_path"], media_data["sha256_hex"]),
+            # Drop rows whose path now holds different content.
+            cursor = conn.executemany(
+                "DELETE FROM media_files WHERE file_path = ? AND sha256_hex != ?",
+                [(d["file_path"], d["sha256_hex"]) for d in media_data_list],
             )
-            existing_sha_for_path = cursor.fetchone()
-            if existing_sha_for_path:
+            if cursor.rowcount > 0:
                 logging.warning(
-                    f"File path {media_data['file_path']} was previously associated with SHA {existing_sha_for_path[0]}. Deleting old entry."
-                )
-                conn.execute(
-                    "DELETE FROM media_files WHERE sha256_hex = ?",
-                    (existing_sha_for_path[0],),
+                    f"Deleted {cursor.rowcount} entries whose file path now has different content."
                 )
-            columns = [
-                "sha256_hex",
-                "filename",
-                "original_filename",
-                "file_path",
-                "last_modified",
-                "original_creation_date",
-                "thumbnail_file",
-                "width",
-                "height",
-                "latitude",
-                "longitude",
-                "city",
-                "country",
-                "mime_type",
-                "filesize",
-                "tags",
-                "tagging_model",
-            ]
-            values = [media_data.get(col) for col in columns]
-            sql = f"INSERT OR REPLACE INTO media_files ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
-            conn.execute(sql, values)
+            sql = f"INSERT OR REPLACE INTO media_files ({', '.join(MEDIA_FILE_COLUMNS)}) VALUES ({', '.join(['?'] * len(MEDIA_FILE_COLUMNS))})"
+            conn.executemany(
+                sql,
+                [[d.get(col) for col in MEDIA_FILE_COLUMNS] for d in media_data_list],
+            )
     except sqlite3.IntegrityError as e:
         logging.error(
-            f"Integrity error adding/updating media file {media_data.get('file_path')} (SHA: {media_data.get('sha256_hex')}): {e}"
+            f"Integrity error adding/updating {len(media_data_list)} media files: {e}"
         )
         raise
     except sqlite3.Error as e:
         logging.error(
-            f"Database error adding/updating media file {media_data.get('file_path')}: {e}"
+            f"Database error adding/updating {len(media_data_list)} media files: {e}"
         )
         raise
+    finally:
+        _bump_media_generation()
 
 
 def get_media_file_by_sha(db_path: str, sha256_hex: str) -> Optional[Dict[str, Any]]:
@@ -316,6 +482,117 @@ def get_all_media_files(db_path: str) -> Dict[str, Dict[str, Any]]:
         return {}
 
 
+def iter_all_media_files(db_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields all media file records, newest first, without loading them all.
+
+    Rows are fetched from the cursor in batches as the caller consumes them,
+    so memory use does not grow with the size of the library.
+
+    Args:
+        db_path: The path to the database file.
+
+    Yields:
+        Media file metadata dictionaries.
+
+    Raises:
+        sqlite3.Error: If the records cannot be read, even part-way through,
+            so that callers never mistake a partial listing for a full one.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute(
+            "SELECT * FROM media_files ORDER BY original_creation_date DESC, filename ASC"
+        )
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+    except sqlite3.Error as e:
+        logging.error(f"Database error iterating media files: {e}")
+        raise
+
+
+def get_media_files_page(
+    db_path: str, limit: int, after: Optional[Tuple[float, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves one page of media file records, newest first.
+
+    Pages are keyed on (original_creation_date, sha256_hex) rather than an
+    offset, so each page is a single index range scan regardless of how deep
+    into the library it is.
+
+    Args:
+        db_path: The path to the database file.
+        limit: The maximum number of records to return.
+        after: The (original_creation_date, sha256_hex) of the last record of
+            the previous page, or None for the first page.
+
+    Returns:
+        A list of media file metadata dictionaries, in page order.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        if after is None:
+            cursor = conn.execute(
+                "SELECT * FROM media_files ORDER BY original_creation_date DESC, sha256_hex DESC LIMIT ?",
+                (limit,),
+            )
+        else:
+            cursor = conn.execute(
+                "SELECT * FROM media_files WHERE (original_creation_date, sha256_hex) < (?, ?) "
+                "ORDER BY original_creation_date DESC, sha256_hex DESC LIMIT ?",
+                (after[0], after[1], limit),
+            )
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Database error retrieving media files page: {e}")
+        return []
+
+
+def media_file_size_exists(db_path: str, filesize: int) -> bool:
+    """
+    Checks whether any media file record has the given size.
+
+    Args:
+        db_path: The path to the database file.
+        filesize: The file size in bytes.
+
+    Returns:
+        True if at least one record has this size, False otherwise.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute(
+            "SELECT 1 FROM media_files WHERE filesize = ? LIMIT 1", (filesize,)
+        )
+        return cursor.fetchone() is not None
+    except sqlite3.Error as e:
+        logging.error(f"Database error checking for file size {filesize}: {e}")
+        return False
+
+
+def count_media_files(db_path: str) -> int:
+    """
+    Returns the number of media file records.
+
+    Args:
+        db_path: The path to the database file.
+
+    Returns:
+        The number of records, or 0 if the count fails.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM media_files").fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Database error counting media files: {e}")
+        return 0
+
+
 def get_all_file_paths_and_last_modified(db_path: str) -> Dict[str, float]:
     """
     Retrieves a mapping of all file paths to their last modified timestamps.
@@ -363,6 +640,36 @@ def delete_media_file_by_sha(db_path: str, sha256_hex: str) -> bool:
     except sqlite3.Error as e:
         logging.error(f"Database error deleting media file by SHA {sha256_hex}: {e}")
         return False
+    finally:
+        _bump_media_generation()
+
+
+def delete_media_files_by_sha(db_path: str, sha256_hexes: List[str]) -> int:
+    """
+    Deletes several media file records by SHA256 hash in one transaction.
+
+    Args:
+        db_path: The path to the database file.
+        sha256_hexes: The SHA256 hashes of the media files to delete.
+
+    Returns:
+        The number of records deleted.
+    """
+    if not sha256_hexes:
+        return 0
+    conn = get_db_connection(db_path)
+    try:
+        with conn:
+            cursor = conn.executemany(
+                "DELETE FROM media_files WHERE sha256_hex = ?",
+                [(sha256_hex,) for sha256_hex in sha256_hexes],
+            )
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        logging.error(f"Database error deleting {len(sha256_hexes)} media files: {e}")
+        return 0
+    finally:
+        _bump_media_generation()
 
 
 def delete_media_file_by_path(db_path: str, file_path: str) -> bool:
@@ -385,6 +692,8 @@ def delete_media_file_by_path(db_path: str, file_path: str) -> bool:
     except sqlite3.Error as e:
         logging.error(f"Database error deleting media file by path {file_path}: {e}")
         return False
+    finally:
+        _bump_media_generation()
 
 
 def get_file_last_modified(db_path: str, file_path: str) -> Optional[float]:
@@ -493,6 +802,8 @@ def update_media_file_fields(
         "filesize",
         "tags",
         "tagging_model",
+        "hash_algo",
+        "hash_mode",
     ]
     update_clauses = []
     update_values = []
@@ -517,6 +828,8 @@ def update_media_file_fields(
     except sqlite3.Error as e:
         logging.error(f"Database error updating fields for SHA {sha256_hex}: {e}")
         return False
+    finally:
+        _bump_media_generation()
 
 
 def get_all_shas_in_db(db_path: str) -> List[str]:
@@ -544,7 +857,7 @@ def get_all_shas_in_db(db_path: str) -> List[str]:
 
 def get_media_files_by_date(db_path: str, date: float) -> Dict[str, Dict[str, Any]]:
     """
-    Retrieves media files created on a specific date.
+    Retrieves media files created on a specific date (in UTC).
 
     Args:
         db_path: The path to the database file.
@@ -553,20 +866,41 @@ def get_media_files_by_date(db_path: str, date: float) -> Dict[str, Dict[str, An
     Returns:
         A dictionary of media files matching the date.
     """
+    # Same as comparing date(..., 'unixepoch') on both sides, but as a range
+    # the creation date index can serve.
+    day_start = date - date % 86400
+    return get_media_files_in_range(db_path, day_start, day_start + 86400)
+
+
+def get_media_files_in_range(
+    db_path: str, start: float, end: float
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Retrieves media files created in the half-open range [start, end).
+
+    The bounds are compared to the column directly, so the query is a range
+    scan on the creation date index.
+
+    Args:
+        db_path: The path to the database file.
+        start: The start of the range, as a Unix timestamp.
+        end: The end of the range (exclusive), as a Unix timestamp.
+
+    Returns:
+        A dictionary of media files within the range.
+    """
     conn = get_db_connection(db_path)
     media_dict = {}
     try:
-        cursor = conn.cursor()
-        # Compare the date part of the timestamp
-        cursor.execute(
-            "SELECT * FROM media_files WHERE date(original_creation_date, 'unixepoch') = date(?, 'unixepoch')",
-            (date,),
+        cursor = conn.execute(
+            "SELECT * FROM media_files WHERE original_creation_date >= ? AND original_creation_date < ?",
+            (start, end),
         )
         for row in cursor.fetchall():
             media_dict[row["sha256_hex"]] = dict(row)
         return media_dict
     except sqlite3.Error as e:
-        logging.error(f"Database error retrieving media files by date: {e}")
+        logging.error(f"Database error retrieving media files in range: {e}")
         return {}
 
 
@@ -633,3 +967,45 @@ def get_media_files_by_location(
     except sqlite3.Error as e:
         logging.error(f"Database error retrieving media files by location: {e}")
         return {}
+
+
+def get_dir_index(db_path: str) -> Dict[str, int]:
+    """
+    Retrieves the directory mtimes recorded by the last scan.
+
+    Args:
+        db_path: The path to the database file.
+
+    Returns:
+        A dictionary mapping directory paths (relative to the storage
+        directory, "" for the root) to their mtime in nanoseconds.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT rel_path, mtime_ns FROM dir_index")
+        return {row["rel_path"]: row["mtime_ns"] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logging.error(f"Database error retrieving directory index: {e}")
+        return {}
+
+
+def replace_dir_index(db_path: str, dir_mtimes: Dict[str, int]) -> None:
+    """
+    Replaces the recorded directory mtimes with those from the latest scan.
+
+    Args:
+        db_path: The path to the database file.
+        dir_mtimes: A dictionary mapping relative directory paths to their
+                    mtime in nanoseconds.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM dir_index")
+            conn.executemany(
+                "INSERT INTO dir_index (rel_path, mtime_ns) VALUES (?, ?)",
+                dir_mtimes.items(),
+            )
+    except sqlite3.Error as e:
+        logging.error(f"Database error replacing directory index: {e}")
@@ -3,6 +3,8 @@ from dataclasses import dataclass
 from math import radians, sin, cos, sqrt, atan2
 from threading import Lock
 
+import numpy as np
+
 
 @dataclass
 class City:
@@ -18,7 +20,8 @@ class GeoLocator:
 
     This class loads a list of cities from a CSV file and provides a method
     to find the closest city to a given latitude and longitude. It uses the
-        Haversine formula to calculate distances.
+        Haversine formula to calculate distances, vectorized over all cities
+        with numpy.
     """
 
     _instance = None
@@ -41,6 +44,10 @@ class GeoLocator:
         """
         self.cities = []
         self.loaded = False
+        # City coordinates in radians, parallel to self.cities
+        self._lats_rad = None
+        self._lons_rad = None
+        self._cos_lats = None
 
     def load_cities(self, csv_file):
         """
@@ -70,8 +77,19 @@ class GeoLocator:
                             country=row[3],
                         )
                     )
+            self._build_coordinate_arrays()
             self.loaded = True
 
+    def _build_coordinate_arrays(self):
+        """Precomputes the city coordinate arrays used by `nearest_city`."""
+        self._lats_rad = np.radians(
+            np.fromiter((city.latitude for city in self.cities), dtype=np.float64)
+        )
+        self._lons_rad = np.radians(
+            np.fromiter((city.longitude for city in self.cities), dtype=np.float64)
+        )
+        self._cos_lats = np.cos(self._lats_rad)
+
     def nearest_city(self, latitude, longitude):
         """
         Finds the nearest city to the given latitude and longitude.
@@ -86,19 +104,19 @@ class GeoLocator:
         """
         if not self.cities:
             return None
-
-        min_distance = float("inf")
-        closest_city = None
-
-        for city in self.cities:
-            distance = self._haversine_distance(
-                latitude, longitude, city.latitude, city.longitude
-            )
-            if distance < min_distance:
-                min_distance = distance
-                closest_city = city
-
-        return closest_city
+        if self._lats_rad is None or len(self._lats_rad) != len(self.cities):
+            self._build_coordinate_arrays()
+
+        # The haversine distance grows monotonically with its `a` term, so the
+        # nearest city is the one minimizing `a`.
+        lat_rad, lon_rad = radians(latitude), radians(longitude)
+        a = (
+            np.sin((self._lats_rad - lat_rad) / 2) ** 2
+            + cos(lat_rad)
+            * self._cos_lats
+            * np.sin((self._lons_rad - lon_rad) / 2) ** 2
+        )
+        return self.cities[int(np.argmin(a))]
 
     def _haversine_distance(self, lat1, lon1, lat2, lon2):
         # Convert latitude and longitude from degrees to radians
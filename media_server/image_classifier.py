@@ -1,4 +1,8 @@
 import os
+import threading
+from typing import List
+
+from absl import logging
 
 os.environ["KERAS_BACKEND"] = "torch"
 
@@ -24,6 +28,8 @@ class ImageClassifier:
         self.model = None
         self.preprocess_input = None
         self.decode_predictions = None
+        # Model inference is not assumed to be thread-safe.
+        self._predict_lock = threading.Lock()
 
         if self.settings.tagging_model == "Resnet":
             self.model = ResNet50V2(weights="imagenet")
@@ -35,19 +41,47 @@ class ImageClassifier:
             self.decode_predictions = mobilenet_decode
 
     def classify_image(self, image_path: str):
+        return self.classify_images([image_path])[0]
+
+    def classify_images(self, image_paths: List[str], batch_size: int = 32):
+        """
+        Classifies several images, running the model on batches of them.
+
+        One forward pass per batch amortizes the per-call overhead of the model
+        (and keeps an accelerator busy) far better than one image at a time.
+        Images that cannot be loaded get no predictions.
+
+        Args:
+            image_paths: Paths of the images to classify.
+            batch_size: Maximum number of images per forward pass.
+
+        Returns:
+            A list with one entry per path, each a list of up to five
+            (label, score) tuples.
+        """
+        results = [[] for _ in image_paths]
         if not self.model:
-            return []
+            return results
 
-        img = image.load_img(image_path, target_size=(224, 224))
-        x = image.img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = self.preprocess_input(x)
+        for start in range(0, len(image_paths), batch_size):
+            indices, arrays = [], []
+            for i in range(start, min(start + batch_size, len(image_paths))):
+                try:
+                    img = image.load_img(image_paths[i], target_size=(224, 224))
+                except Exception as e:
+                    logging.warning(f"Could not load {image_paths[i]} for tagging: {e}")
+                    continue
+                indices.append(i)
+                arrays.append(image.img_to_array(img))
+            if not arrays:
+                continue
+            x = self.preprocess_input(np.stack(arrays))
 
-        preds = self.model.predict(x)
-        decoded_preds = self.decode_predictions(preds, top=5)
+            with self._predict_lock:
+                preds = self.model.predict(x, batch_size=len(arrays))
+            decoded_preds = self.decode_predictions(preds, top=5)
 
-        # The result is a list of lists of predictions, one for each image in the batch
-        predictions = []
-        for _, label, score in decoded_preds[0]:
-            predictions.append((label, float(score)))
-        return predictions
+            # The result is a list of lists of predictions, one for each image in the batch
+            for i, image_preds in zip(indices, decoded_preds):
+                results[i] = [(label, float(score)) for _, label, score in image_preds]
+        return results
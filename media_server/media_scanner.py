@@ -1,11 +1,15 @@
 import os
+import collections
+import functools
 import hashlib
 import mimetypes
 from absl import logging
-from typing import Dict, Optional, Tuple, Set
-from PIL import Image, ImageOps, ExifTags
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import PIL
+from PIL import Image, ImageOps
 from datetime import datetime
 from pillow_heif import register_heif_opener
+import piexif
 import concurrent.futures
 
 try:
@@ -21,18 +25,24 @@ except ImportError:
     from media_server.image_classifier import ImageClassifier
     from media_server.settings import SettingsManager
 
+try:
+    from blake3 import blake3 as _blake3  # Optional, faster content hash
+except ImportError:
+    _blake3 = None
+
 # Initialize mimetypes database
 mimetypes.init()
 
 # Register HEIF opener for Pillow
 register_heif_opener()
 
-# GPS EXIF Processing
-GPS_TAG_ID = None
-for k, v in ExifTags.TAGS.items():
-    if v == "GPSInfo":
-        GPS_TAG_ID = k
-        break
+# GPS EXIF Processing: the GPSInfo IFD pointer tag (ExifTags.Base.GPSInfo).
+GPS_TAG_ID = 0x8825
+
+# Date tags: DateTimeOriginal lives in the Exif sub-IFD, DateTime in IFD0.
+EXIF_IFD_TAG = 0x8769
+DATE_TIME_ORIGINAL_TAG = 36867
+DATE_TIME_TAG = 306
 
 # GPSInfo sub-tags (values are integers)
 GPS_LATITUDE_REF_TAG = 1
@@ -41,30 +51,37 @@ GPS_LONGITUDE_REF_TAG = 3
 GPS_LONGITUDE_TAG = 4
 
 
+_INV_60 = 1.0 / 60.0
+_INV_3600 = 1.0 / 3600.0
+_NEGATIVE_GPS_REFS = frozenset(("S", "W"))
+_POSITIVE_GPS_REFS = frozenset(("N", "E"))
+
+
+def _to_float(val) -> float:
+    """Converts an EXIF rational (numerator, denominator) or number to float."""
+    if isinstance(val, tuple) and len(val) == 2:
+        return float(val[0]) / float(val[1])
+    return float(val)
+
+
 def _convert_dms_to_decimal(dms_tuple: Tuple[float, ...], ref: str) -> Optional[float]:
     """Converts GPS DMS (Degrees, Minutes, Seconds) to decimal degrees."""
     if not dms_tuple or len(dms_tuple) != 3:
         return None
 
     try:
-
-        def to_float(val):
-            if isinstance(val, tuple) and len(val) == 2:
-                return float(val[0]) / float(val[1])
-            return float(val)
-
-        degrees_val = to_float(dms_tuple[0])
-        minutes_val = to_float(dms_tuple[1])
-        seconds_val = to_float(dms_tuple[2])
+        degrees_val = _to_float(dms_tuple[0])
+        minutes_val = _to_float(dms_tuple[1])
+        seconds_val = _to_float(dms_tuple[2])
     except (TypeError, ValueError, ZeroDivisionError) as e:
         logging.warning(f"Could not parse DMS component: {dms_tuple}. Error: {e}")
         return None
 
-    decimal_degrees = degrees_val + (minutes_val / 60.0) + (seconds_val / 3600.0)
+    decimal_degrees = degrees_val + minutes_val * _INV_60 + seconds_val * _INV_3600
 
-    if ref in ["S", "W"]:
-        decimal_degrees = -decimal_degrees
-    elif ref not in ["N", "E"]:
+    if ref in _NEGATIVE_GPS_REFS:
+        return -decimal_degrees
+    if ref not in _POSITIVE_GPS_REFS:
         logging.warning(f"Invalid GPS reference: {ref}")
         return None
     return decimal_degrees
@@ -87,7 +104,7 @@ def _get_gps_coordinates_from_exif(
     if not gps_info:
         return None, None
 
-    logging.info(f"GPS Info: {gps_info}")
+    logging.debug("GPS Info: %s", gps_info)
     try:
         gps_latitude_raw = gps_info.get(GPS_LATITUDE_TAG)
         gps_latitude_ref = gps_info.get(GPS_LATITUDE_REF_TAG)
@@ -105,9 +122,170 @@ def _get_gps_coordinates_from_exif(
     return latitude, longitude
 
 
+def _decode_exif_ascii(value) -> Optional[str]:
+    """Decodes a raw EXIF ASCII value (bytes, NUL-terminated) to str."""
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="ignore").rstrip("\x00") or None
+    return value
+
+
+EXIF_DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+def parse_exif_datetime(value: str) -> datetime:
+    """
+    Parses an EXIF 'YYYY:MM:DD HH:MM:SS' timestamp.
+
+    Equivalent to `datetime.strptime(value, EXIF_DATETIME_FORMAT)`, but
+    well-formed values are sliced at fixed offsets instead of interpreting the
+    format string on every call. Anything else goes through `strptime`.
+
+    Raises:
+        ValueError: If the value is not a valid timestamp.
+        TypeError: If the value is not a string.
+    """
+    if (
+        len(value) == 19
+        and value[4] == value[7] == value[13] == value[16] == ":"
+        and value[10] == " "
+    ):
+        try:
+            return datetime(
+                int(value[0:4]),
+                int(value[5:7]),
+                int(value[8:10]),
+                int(value[11:13]),
+                int(value[14:16]),
+                int(value[17:19]),
+            )
+        except ValueError:
+            pass  # Let strptime decide, and raise its usual error.
+    return datetime.strptime(value, EXIF_DATETIME_FORMAT)
+
+
+def _read_exif_fields(img) -> Tuple[Optional[str], Optional[float], Optional[float]]:
+    """
+    Reads the capture date string and GPS coordinates from an opened image.
+
+    When Pillow has already loaded the raw EXIF block (e.g. the JPEG APP1
+    segment) it is parsed directly with piexif, which only walks the IFDs we
+    need. Other formats fall back to `Image.getexif()`.
+
+    Args:
+        img: An open PIL image.
+
+    Returns:
+        A tuple of (EXIF date string, latitude, longitude); any may be None.
+    """
+    raw_exif = img.info.get("exif")
+    if raw_exif:
+        try:
+            exif_dict = piexif.load(raw_exif)
+        except Exception as e:
+            logging.debug("piexif could not parse EXIF, using Pillow: %s", e)
+        else:
+            exif_date_str = _decode_exif_ascii(
+                exif_dict["Exif"].get(piexif.ExifIFD.DateTimeOriginal)
+                or exif_dict["0th"].get(piexif.ImageIFD.DateTime)
+            )
+            gps_info = exif_dict.get("GPS") or {}
+            latitude = longitude = None
+            if gps_info.get(GPS_LATITUDE_TAG) and gps_info.get(GPS_LATITUDE_REF_TAG):
+                latitude = _convert_dms_to_decimal(
+                    gps_info[GPS_LATITUDE_TAG],
+                    _decode_exif_ascii(gps_info[GPS_LATITUDE_REF_TAG]),
+                )
+            if gps_info.get(GPS_LONGITUDE_TAG) and gps_info.get(GPS_LONGITUDE_REF_TAG):
+                longitude = _convert_dms_to_decimal(
+                    gps_info[GPS_LONGITUDE_TAG],
+                    _decode_exif_ascii(gps_info[GPS_LONGITUDE_REF_TAG]),
+                )
+            return exif_date_str, latitude, longitude
+
+    exif_data = img.getexif()
+    if not exif_data:
+        return None, None, None
+    exif_date_str = exif_data.get_ifd(EXIF_IFD_TAG).get(
+        DATE_TIME_ORIGINAL_TAG
+    ) or exif_data.get(DATE_TIME_TAG)
+    latitude, longitude = _get_gps_coordinates_from_exif(exif_data)
+    return exif_date_str, latitude, longitude
+
+
 THUMBNAIL_DIR_NAME = ".thumbnails"
+# Thumbnail resizing (LANCZOS) is the main CPU cost of a scan. Pillow-SIMD is a
+# drop-in replacement for Pillow with SSE4/AVX2 resampling kernels, installed
+# with `pip uninstall pillow && CC="cc -mavx2" pip install pillow-simd`; its
+# versions carry a ".postN" suffix, which scan_directory logs on startup.
 THUMBNAIL_SIZE = (256, 256)
 THUMBNAIL_EXTENSION = ".png"
+# zlib level for thumbnail PNGs. Level 1 encodes several times faster than
+# Pillow's default of 6 and the files are only slightly larger at this size.
+THUMBNAIL_PNG_COMPRESS_LEVEL = 1
+# Image modes that can be written to PNG without conversion.
+_PNG_MODES = frozenset(("1", "L", "LA", "I", "I;16", "P", "RGB", "RGBA"))
+
+# Algorithm used for content addressing. "blake3" requires the optional
+# blake3 package; both produce 64-character hex digests.
+SUPPORTED_HASH_ALGOS = ("sha256", "blake3")
+HASH_ALGO = "sha256"
+
+# When enabled, videos larger than SPARSE_HASH_MIN_SIZE are identified by a
+# fingerprint of their first and last SPARSE_HASH_CHUNK bytes plus their size
+# ("sparse" hash_mode) instead of hashing the whole file ("full").
+SPARSE_VIDEO_HASH = False
+SPARSE_HASH_MIN_SIZE = 32 << 20
+SPARSE_HASH_CHUNK = 1 << 20
+
+# Block size for streaming file hashes.
+HASH_READ_SIZE = 1 << 20
+
+# Threads listing directories during a scan. Listing is bound by readdir and
+# stat latency, which release the GIL, so this can exceed the CPU count.
+SCAN_LIST_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def new_content_hasher():
+    """
+    Returns a new hash object for the configured `HASH_ALGO`.
+
+    Raises:
+        RuntimeError: If `HASH_ALGO` is "blake3" but the blake3 package is
+            not installed.
+    """
+    if HASH_ALGO == "blake3":
+        if _blake3 is None:
+            raise RuntimeError(
+                "HASH_ALGO is 'blake3' but the blake3 package is not installed."
+            )
+        return _blake3(max_threads=_blake3.AUTO)
+    return hashlib.sha256()
+
+
+def _hash_file_contents(file_path: str, hasher) -> str:
+    """
+    Feeds a whole file into `hasher` and returns its hex digest.
+
+    The file is read unbuffered in HASH_READ_SIZE blocks into a single reused
+    buffer, so there is one syscall and one `update()` call per MiB and no
+    per-block allocation.
+
+    Raises:
+        IOError: If the file cannot be read.
+    """
+    buffer = memoryview(bytearray(HASH_READ_SIZE))
+    with open(file_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass  # Only a readahead hint.
+        while True:
+            bytes_read = f.readinto(buffer)
+            if not bytes_read:
+                break
+            hasher.update(buffer[:bytes_read])
+    return hasher.hexdigest()
 
 
 def get_file_sha256(file_path: str) -> Optional[str]:
@@ -121,17 +299,248 @@ def get_file_sha256(file_path: str) -> Optional[str]:
         The SHA256 hash as a hexadecimal string, or None if the file
         could not be read.
     """
-    sha256_hash = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        return _hash_file_contents(file_path, hashlib.sha256())
+    except IOError:
+        logging.error(f"Could not read file for hashing: {file_path}")
+        return None
+
+
+def _get_hash_mode(mime_type: Optional[str], size: int) -> str:
+    """Returns "sparse" if a file of this type and size gets a sparse fingerprint."""
+    if (
+        SPARSE_VIDEO_HASH
+        and mime_type
+        and mime_type.startswith("video/")
+        and size > SPARSE_HASH_MIN_SIZE
+    ):
+        return "sparse"
+    return "full"
+
+
+def _sparse_fingerprint(head: bytes, tail: bytes, size: int) -> str:
+    """Hashes the head and tail of a file together with its little-endian size."""
+    hasher = new_content_hasher()
+    hasher.update(head)
+    hasher.update(tail)
+    hasher.update(size.to_bytes(8, "little"))
+    return hasher.hexdigest()
+
+
+def get_bytes_hash(data: bytes, mime_type: Optional[str]) -> Tuple[str, str]:
+    """
+    Computes the content hash of in-memory file data.
+
+    This matches what `get_file_hash(..., fast=SPARSE_VIDEO_HASH)` returns for
+    the same content on disk, so uploads deduplicate against scanned files.
+
+    Args:
+        data: The file contents.
+        mime_type: The MIME type of the file, if known.
+
+    Returns:
+        A tuple of (hexadecimal hash, hash mode).
+    """
+    hash_mode = _get_hash_mode(mime_type, len(data))
+    if hash_mode == "sparse":
+        return (
+            _sparse_fingerprint(
+                data[:SPARSE_HASH_CHUNK], data[-SPARSE_HASH_CHUNK:], len(data)
+            ),
+            hash_mode,
+        )
+    hasher = new_content_hasher()
+    hasher.update(data)
+    return hasher.hexdigest(), hash_mode
+
+
+def _file_sparse_fingerprint(file_path: str, size: int) -> str:
+    """
+    Computes the sparse fingerprint of a file of the given size on disk.
+
+    Raises:
+        IOError: If the file cannot be read.
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(SPARSE_HASH_CHUNK)
+        f.seek(size - SPARSE_HASH_CHUNK)
+        tail = f.read(SPARSE_HASH_CHUNK)
+    return _sparse_fingerprint(head, tail, size)
+
+
+def _iter_stream_blocks(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    Yields the rest of a binary stream in blocks of up to `HASH_READ_SIZE`.
+
+    Blocks are read into a single reused buffer where the stream supports
+    `readinto`, so each block is only valid until the next one is read.
+    """
+    if hasattr(stream, "readinto"):
+        buffer = memoryview(bytearray(HASH_READ_SIZE))
+        return iter(lambda: buffer[: stream.readinto(buffer) or 0], b"")
+    # SpooledTemporaryFile only gained readinto() in Python 3.11.
+    return iter(lambda: stream.read(HASH_READ_SIZE), b"")
+
+
+def get_stream_hash(
+    stream: BinaryIO, mime_type: Optional[str], size: int
+) -> Tuple[str, str]:
+    """
+    Computes the content hash of a seekable binary stream from its start.
+
+    The hash matches what `get_bytes_hash` returns for the same content. The
+    stream's position afterwards is unspecified.
+
+    Args:
+        stream: A readable, seekable binary stream.
+        mime_type: The MIME type of the data, if known.
+        size: The total size of the stream's data.
+
+    Returns:
+        A tuple of (hexadecimal hash, hash mode).
+    """
+    hash_mode = _get_hash_mode(mime_type, size)
+    stream.seek(0)
+    if hash_mode == "sparse":
+        head = stream.read(SPARSE_HASH_CHUNK)
+        stream.seek(size - SPARSE_HASH_CHUNK)
+        tail = stream.read(SPARSE_HASH_CHUNK)
+        return _sparse_fingerprint(head, tail, size), hash_mode
+    hasher = new_content_hasher()
+    for block in _iter_stream_blocks(stream):
+        hasher.update(block)
+    return hasher.hexdigest(), hash_mode
+
+
+def save_stream_with_hash(
+    stream: BinaryIO, dest_path: str, mime_type: Optional[str]
+) -> Tuple[str, str]:
+    """
+    Copies a binary stream to a file, hashing the data on the way through.
+
+    The data is read in `HASH_READ_SIZE` blocks into a single reused buffer
+    (the same `readinto` loop as `hashlib.file_digest`), so memory use does
+    not grow with the size of the stream. The hash matches what
+    `get_bytes_hash` returns for the same content.
+
+    Args:
+        stream: A readable binary stream, e.g. an uploaded file.
+        dest_path: The path of the file to write.
+        mime_type: The MIME type of the data, if known.
+
+    Returns:
+        A tuple of (hexadecimal hash, hash mode).
+
+    Raises:
+        IOError: If the file cannot be written.
+    """
+    hasher = new_content_hasher()
+    size = 0
+    with open(dest_path, "wb") as f:
+        for block in _iter_stream_blocks(stream):
+            hasher.update(block)
+            f.write(block)
+            size += len(block)
+    hash_mode = _get_hash_mode(mime_type, size)
+    if hash_mode == "sparse":
+        # dest_path may be a temporary name without the media extension, so
+        # fingerprint it directly rather than via get_file_hash.
+        return _file_sparse_fingerprint(dest_path, size), hash_mode
+    return hasher.hexdigest(), hash_mode
+
+
+def drop_page_cache(file_path: str) -> None:
+    """
+    Writes a file's data to disk and drops it from the page cache.
+
+    Meant for files that were just written and will not be read again soon,
+    such as uploaded originals, so that they do not push frequently read
+    files (thumbnails, the database) out of memory. Dirty pages cannot be
+    dropped, hence the flush first. Does nothing where `posix_fadvise` is
+    unavailable.
+
+    Args:
+        file_path: The path of the file.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError as e:
+        logging.warning(f"Could not open {file_path} to drop it from the cache: {e}")
+        return
+    try:
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError as e:
+        logging.warning(f"Could not drop {file_path} from the page cache: {e}")
+    finally:
+        os.close(fd)
+
+
+def get_file_hash(
+    file_path: str,
+    *,
+    fast: bool = False,
+    size: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Computes the content hash of a file using the configured `HASH_ALGO`.
+
+    Args:
+        file_path: The absolute path to the file.
+        fast: If True and sparse video hashing is enabled, large videos are
+            fingerprinted from their head, tail and size instead of being
+            hashed in full.
+        size: The file's size, if already known, to avoid stat'ing it again.
+
+    Returns:
+        The hash as a hexadecimal string, or None if the file could not be read.
+    """
+    if fast and SPARSE_VIDEO_HASH:
+        try:
+            if size is None:
+                size = os.path.getsize(file_path)
+            mime_type = guess_mime_type(file_path)
+            if _get_hash_mode(mime_type, size) == "sparse":
+                return _file_sparse_fingerprint(file_path, size)
+        except IOError:
+            logging.error(f"Could not read file for hashing: {file_path}")
+            return None
+
+    # Files are read rather than memory-mapped, for BLAKE3 too: a file
+    # truncated by another process while mapped would kill the server with
+    # SIGBUS, where a read just fails.
+    try:
+        return _hash_file_contents(file_path, new_content_hasher())
     except IOError:
         logging.error(f"Could not read file for hashing: {file_path}")
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def _mime_type_for_extension(extension: str) -> Optional[str]:
+    """Returns the MIME type for a lower-case file extension (e.g. ".jpg")."""
+    mime_type, _ = mimetypes.guess_type("file" + extension)
+    return mime_type
+
+
+def guess_mime_type(file_path: str) -> Optional[str]:
+    """
+    Guesses a file's MIME type from its extension.
+
+    Equivalent to `mimetypes.guess_type(file_path)[0]` for media files, but
+    memoized per extension since a library has only a handful of them.
+
+    Args:
+        file_path: The path or name of the file.
+
+    Returns:
+        The MIME type, or None if the extension is unknown.
+    """
+    return _mime_type_for_extension(os.path.splitext(file_path)[1].lower())
+
+
 def is_media_file(file_path: str) -> bool:
     """
     Determines if a file is a media file based on its MIME type.
@@ -142,17 +551,33 @@ def is_media_file(file_path: str) -> bool:
     Returns:
         True if the file is an image or video, False otherwise.
     """
-    mime_type, _ = mimetypes.guess_type(file_path)
+    mime_type = guess_mime_type(file_path)
     if mime_type:
         return mime_type.startswith("image/") or mime_type.startswith("video/")
     return False
 
 
+def _thumbnail_paths(thumbnail_dir: str, sha256_hex: str) -> Tuple[str, str]:
+    """
+    Returns the (absolute, relative to `thumbnail_dir`) paths of a thumbnail.
+
+    Thumbnails live in a subdirectory named with the first two characters of
+    the SHA256 hash, e.g. 'ab/abcdef....png'.
+    """
+    sha256_prefix = sha256_hex[:2]
+    thumbnail_filename_only = sha256_hex + THUMBNAIL_EXTENSION
+    return (
+        os.path.join(thumbnail_dir, sha256_prefix, thumbnail_filename_only),
+        os.path.join(sha256_prefix, thumbnail_filename_only),
+    )
+
+
 def generate_thumbnail(
     source_image_path: str,
     thumbnail_dir: str,  # Absolute path to .thumbnails directory
     sha256_hex: str,
     target_size: Tuple[int, int] = THUMBNAIL_SIZE,
+    letterbox: bool = False,
 ) -> Optional[str]:
     """
     Generates a thumbnail for a given image file.
@@ -165,6 +590,9 @@ def generate_thumbnail(
         thumbnail_dir: The absolute path to the base directory for thumbnails.
         sha256_hex: The SHA256 hash of the source image.
         target_size: A tuple specifying the target width and height of the thumbnail.
+        letterbox: If True, the thumbnail is centered on a transparent canvas
+            of exactly `target_size`; otherwise it keeps the image's aspect
+            ratio and fits within `target_size`.
 
     Returns:
         The relative path to the generated thumbnail, or None if generation fails.
@@ -173,37 +601,18 @@ def generate_thumbnail(
         logging.error(f"Invalid sha256_hex for thumbnail generation: {sha256_hex}")
         return None
 
-    sha256_prefix = sha256_hex[:2]
-    # thumbnail_subdir is absolute: e.g. /path/to/storage/.thumbnails/ab
-    thumbnail_subdir_abs = os.path.join(thumbnail_dir, sha256_prefix)
-    os.makedirs(thumbnail_subdir_abs, exist_ok=True)
-
-    thumbnail_filename_only = sha256_hex + THUMBNAIL_EXTENSION
-    # thumbnail_path_absolute is the full absolute path for saving: e.g. /path/to/storage/.thumbnails/ab/hash.png
-    thumbnail_path_absolute = os.path.join(
-        thumbnail_subdir_abs, thumbnail_filename_only
+    thumbnail_path_absolute, thumbnail_path_relative_to_basedir = _thumbnail_paths(
+        thumbnail_dir, sha256_hex
     )
-    # Path to be returned and stored in DB should be relative to thumbnail_dir: e.g. 'ab/hash.png'
-    thumbnail_path_relative_to_basedir = os.path.join(
-        sha256_prefix, thumbnail_filename_only
-    )
-
     if os.path.exists(thumbnail_path_absolute):
-        logging.debug(f"Thumbnail already exists: {thumbnail_path_absolute}")
+        logging.debug("Thumbnail already exists: %s", thumbnail_path_absolute)
         return thumbnail_path_relative_to_basedir
 
     try:
         with Image.open(source_image_path) as img:
-            img.thumbnail(target_size, Image.Resampling.LANCZOS)
-            final_thumb = Image.new("RGBA", target_size, (0, 0, 0, 0))
-            paste_x = (target_size[0] - img.width) // 2
-            paste_y = (target_size[1] - img.height) // 2
-            final_thumb.paste(img, (paste_x, paste_y))
-            final_thumb.save(thumbnail_path_absolute, "PNG")
-            logging.info(
-                f"Generated thumbnail: {thumbnail_path_absolute} for {source_image_path}"
+            return generate_thumbnail_from_image(
+                img, thumbnail_dir, sha256_hex, target_size, letterbox
             )
-            return thumbnail_path_relative_to_basedir
     except FileNotFoundError:
         logging.error(
             f"Source image not found for thumbnail generation: {source_image_path}"
@@ -213,6 +622,110 @@ def generate_thumbnail(
     return None
 
 
+def generate_thumbnail_from_image(
+    img: Image.Image,
+    thumbnail_dir: str,
+    sha256_hex: str,
+    target_size: Tuple[int, int] = THUMBNAIL_SIZE,
+    letterbox: bool = False,
+) -> Optional[str]:
+    """
+    Generates a thumbnail from an already opened image.
+
+    This lets callers that open an image for its metadata reuse the same
+    decoder instead of opening the file a second time. `img` is downscaled in
+    place, so read anything else needed from it (e.g. `img.size`) first.
+
+    Args:
+        img: The open source image.
+        thumbnail_dir: The absolute path to the base directory for thumbnails.
+        sha256_hex: The SHA256 hash of the source image.
+        target_size: A tuple specifying the target width and height of the thumbnail.
+        letterbox: If True, the thumbnail is centered on a transparent canvas
+            of exactly `target_size`.
+
+    Returns:
+        The relative path to the generated thumbnail, or None if generation fails.
+    """
+    if not sha256_hex or len(sha256_hex) < 2:
+        logging.error(f"Invalid sha256_hex for thumbnail generation: {sha256_hex}")
+        return None
+
+    thumbnail_path_absolute, thumbnail_path_relative_to_basedir = _thumbnail_paths(
+        thumbnail_dir, sha256_hex
+    )
+    source_description = getattr(img, "filename", None) or sha256_hex
+    try:
+        os.makedirs(os.path.dirname(thumbnail_path_absolute), exist_ok=True)
+        # Let libjpeg decode at a reduced scale (down to 1/8) when the
+        # source is much larger than the thumbnail. Keeping twice the
+        # target size leaves LANCZOS enough detail; non-JPEGs ignore this.
+        img.draft("RGB", (target_size[0] * 2, target_size[1] * 2))
+        img.thumbnail(target_size, Image.Resampling.LANCZOS)
+        if letterbox:
+            final_thumb = Image.new("RGBA", target_size, (0, 0, 0, 0))
+            paste_x = (target_size[0] - img.width) // 2
+            paste_y = (target_size[1] - img.height) // 2
+            final_thumb.paste(img, (paste_x, paste_y))
+        elif img.mode in _PNG_MODES:
+            final_thumb = img
+        else:
+            final_thumb = img.convert("RGBA")  # e.g. CMYK JPEGs
+        final_thumb.save(
+            thumbnail_path_absolute, "PNG", compress_level=THUMBNAIL_PNG_COMPRESS_LEVEL
+        )
+        logging.debug(
+            "Generated thumbnail: %s for %s",
+            thumbnail_path_absolute,
+            source_description,
+        )
+        return thumbnail_path_relative_to_basedir
+    except Exception as e:
+        logging.error(f"Failed to generate thumbnail for {source_description}: {e}")
+    return None
+
+
+def _list_thumbnail_files(thumbnail_dir_abs: str) -> Tuple[Set[str], List[str]]:
+    """
+    Lists the thumbnail files on disk with one scandir per prefix directory.
+
+    Thumbnails live at most one level deep ('ab/hash.png', or legacy flat
+    'hash.png'), so that layout is enumerated directly.
+
+    Args:
+        thumbnail_dir_abs: The absolute path to the thumbnail directory.
+
+    Returns:
+        A tuple of (set of thumbnail paths relative to `thumbnail_dir_abs`,
+        list of absolute paths of the prefix subdirectories).
+    """
+    thumb_rel_paths = set()
+    subdirs = []
+    for entry in os.scandir(thumbnail_dir_abs):
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+            prefix = entry.name + os.sep
+            thumb_rel_paths.update(
+                prefix + file_name
+                for file_name in os.listdir(entry.path)
+                if file_name.endswith(THUMBNAIL_EXTENSION)
+            )
+        elif entry.name.endswith(THUMBNAIL_EXTENSION):
+            thumb_rel_paths.add(entry.name)
+    return thumb_rel_paths, subdirs
+
+
+def _thumbnail_exists(
+    thumbnail_dir_abs: str,
+    thumbnail_rel_path: str,
+    existing_thumbnails: Optional[Set[str]] = None,
+) -> bool:
+    """Checks for a thumbnail in `existing_thumbnails`, or on disk if not given."""
+    if existing_thumbnails is not None:
+        return thumbnail_rel_path in existing_thumbnails
+    return os.path.exists(os.path.join(thumbnail_dir_abs, thumbnail_rel_path))
+
+
 def _delete_thumbnail_file(
     thumbnail_dir_abs: str, thumbnail_relative_path: Optional[str]
 ):
@@ -246,7 +759,204 @@ def _delete_thumbnail_file(
             )
 
 
-def scan_directory(storage_dir: str, db_path: str, rescan: bool = False) -> None:
+def _list_media_dir(
+    dir_abs: str, dir_rel: str, cached_mtime_ns: Optional[int]
+) -> Tuple[
+    Optional[int],
+    Optional[List[Tuple[str, str, float, int]]],
+    List[Tuple[str, str]],
+]:
+    """
+    Lists one directory for `_scan_media_entries`.
+
+    Args:
+        dir_abs: The absolute path of the directory.
+        dir_rel: Its path relative to the storage directory.
+        cached_mtime_ns: Its mtime from the previous scan, or None.
+
+    Returns:
+        A tuple of:
+        - the directory's mtime in nanoseconds, or None if it cannot be stat'ed,
+        - its media files as (relative path, absolute path, mtime, size), or
+          None if its mtime equals `cached_mtime_ns` and it was not listed, and
+        - its subdirectories as (absolute path, relative path).
+    """
+    try:
+        dir_mtime_ns = os.stat(dir_abs).st_mtime_ns
+    except OSError as e:
+        logging.error(f"Could not stat directory {dir_abs}: {e}")
+        return None, None, []
+    if cached_mtime_ns == dir_mtime_ns:
+        return dir_mtime_ns, None, []
+
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(dir_abs) as it:
+            for entry in it:
+                rel_path = os.path.join(dir_rel, entry.name) if dir_rel else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != THUMBNAIL_DIR_NAME:
+                            subdirs.append((entry.path, rel_path))
+                    elif entry.is_file() and is_media_file(entry.name):
+                        stat_result = entry.stat()
+                        files.append(
+                            (
+                                rel_path,
+                                entry.path,
+                                stat_result.st_mtime,
+                                stat_result.st_size,
+                            )
+                        )
+                except OSError as e:
+                    logging.warning(f"Could not stat {entry.path}: {e}")
+    except OSError as e:
+        logging.error(f"Could not list directory {dir_abs}: {e}")
+    return dir_mtime_ns, files, subdirs
+
+
+def _scan_media_entries(
+    abs_storage_dir: str,
+    cached_dir_mtimes: Optional[Dict[str, int]] = None,
+    known_files: Optional[Dict[str, Tuple[float, int]]] = None,
+) -> Tuple[Dict[str, Tuple[str, float, int]], Dict[str, int]]:
+    """
+    Walks the storage directory once, collecting media files.
+
+    The thumbnail directory is skipped and symlinked directories are not
+    followed. Each file is stat'ed at most once via its `os.DirEntry`.
+    Directories are listed concurrently on `SCAN_LIST_WORKERS` threads, each
+    subdirectory being queued as soon as its parent has been listed.
+
+    If `cached_dir_mtimes` is given, directories whose mtime still matches
+    are not listed: a directory's mtime only changes when entries are added,
+    removed or renamed in it, so its files are taken from `known_files` and
+    its subdirectories from the cache (and checked in turn). Files modified
+    in place inside such directories are not detected.
+
+    Args:
+        abs_storage_dir: The absolute path to the storage directory.
+        cached_dir_mtimes: Optional {relative dir path: mtime_ns} from the
+            previous scan, with "" for the storage directory itself.
+        known_files: {relative file path: (mtime, size)} for files already in
+            the database; required when `cached_dir_mtimes` is given.
+
+    Returns:
+        A tuple of:
+        - a dictionary mapping each media file's path relative to
+          `abs_storage_dir` to a tuple of (absolute path, mtime, size), and
+        - a dictionary mapping every visited directory's relative path to its
+          mtime in nanoseconds.
+    """
+    entries: Dict[str, Tuple[str, float, int]] = {}
+    dir_mtimes: Dict[str, int] = {}
+
+    cached_subdirs = collections.defaultdict(list)
+    known_files_by_dir = collections.defaultdict(list)
+    if cached_dir_mtimes is not None:
+        for dir_rel in cached_dir_mtimes:
+            if dir_rel:
+                cached_subdirs[os.path.dirname(dir_rel)].append(dir_rel)
+        for rel_path, (mtime, size) in (known_files or {}).items():
+            known_files_by_dir[os.path.dirname(rel_path)].append(
+                (rel_path, mtime, size)
+            )
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=SCAN_LIST_WORKERS
+    ) as executor:
+        pending = {}  # {future: relative dir path}
+
+        def submit(dir_abs, dir_rel):
+            cached_mtime_ns = (
+                cached_dir_mtimes.get(dir_rel)
+                if cached_dir_mtimes is not None
+                else None
+            )
+            future = executor.submit(_list_media_dir, dir_abs, dir_rel, cached_mtime_ns)
+            pending[future] = dir_rel
+
+        submit(abs_storage_dir, "")
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                dir_rel = pending.pop(future)
+                dir_mtime_ns, files, subdirs = future.result()
+                if dir_mtime_ns is None:
+                    continue
+                dir_mtimes[dir_rel] = dir_mtime_ns
+
+                if files is None:
+                    # Unchanged since the last scan: reuse what the DB knows.
+                    for rel_path, mtime, size in known_files_by_dir[dir_rel]:
+                        entries[rel_path] = (
+                            os.path.join(abs_storage_dir, rel_path),
+                            mtime,
+                            size,
+                        )
+                    subdirs = [
+                        (os.path.join(abs_storage_dir, subdir_rel), subdir_rel)
+                        for subdir_rel in cached_subdirs[dir_rel]
+                    ]
+                else:
+                    for rel_path, abs_path, mtime, size in files:
+                        entries[rel_path] = (abs_path, mtime, size)
+                for subdir_abs, subdir_rel in subdirs:
+                    submit(subdir_abs, subdir_rel)
+    return entries, dir_mtimes
+
+
+def _is_db_entry_current(db_entry: Dict, mtime: float, size: int) -> bool:
+    """
+    Checks whether a database row still describes a file on disk.
+
+    A row is current if the file's mtime and size match it and its hash was
+    computed with the configured algorithm and mode, so the stored hash can be
+    reused without reading the file.
+
+    Args:
+        db_entry: The database row for the file's path.
+        mtime: The file's modification time.
+        size: The file's size in bytes.
+
+    Returns:
+        True if the stored hash and metadata are still valid, False otherwise.
+    """
+    return (
+        abs(mtime - db_entry["last_modified"]) <= 1e-6
+        and db_entry.get("filesize") == size
+        and (db_entry.get("hash_algo") or "sha256") == HASH_ALGO
+        and (db_entry.get("hash_mode") or "full")
+        == _get_hash_mode(db_entry.get("mime_type"), size)
+    )
+
+
+def scan_directory(
+    storage_dir: str,
+    db_path: str,
+    rescan: bool = False,
+    prune_unchanged_dirs: bool = False,
+    changed_dirs: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Scans the storage directory and brings the database up to date.
+
+    Args:
+        storage_dir: The directory containing media files.
+        db_path: The path to the database file.
+        rescan: If True, only new, modified and deleted files are processed;
+            otherwise every media file is processed.
+        prune_unchanged_dirs: If True (and `rescan`), directories whose mtime
+            has not changed since the last scan are not re-listed. This is much
+            faster on large static libraries, but misses files edited in place.
+        changed_dirs: Paths, relative to `storage_dir`, of directories known to
+            have changed (e.g. from filesystem notifications). With
+            `prune_unchanged_dirs` these are listed even if their mtime is
+            unchanged, so files edited in place in them are picked up.
+    """
     if not os.path.isdir(storage_dir):
         logging.error(f"Storage directory not found: {storage_dir}")
         return
@@ -254,6 +964,13 @@ def scan_directory(storage_dir: str, db_path: str, rescan: bool = False) -> None
     thumbnail_dir_abs = os.path.join(storage_dir, THUMBNAIL_DIR_NAME)
     os.makedirs(thumbnail_dir_abs, exist_ok=True)
     logging.info(f"Thumbnail directory ensured at: {thumbnail_dir_abs}")
+    # One listing up front instead of a stat per file; read-only while the
+    # worker threads run.
+    existing_thumbnails, _ = _list_thumbnail_files(thumbnail_dir_abs)
+    logging.info(
+        f"Using Pillow {PIL.__version__}"
+        f"{' (SIMD build)' if '.post' in PIL.__version__ else ''} for thumbnails."
+    )
 
     settings_manager = SettingsManager(os.path.join(storage_dir, ".settings.json"))
     settings = settings_manager.get()
@@ -264,86 +981,143 @@ def scan_directory(storage_dir: str, db_path: str, rescan: bool = False) -> None
     geolocator.load_cities(cities_csv_path)
 
     abs_storage_dir = os.path.abspath(storage_dir)
-    processed_rel_file_paths: Set[str] = set()
-    media_to_process = []
 
-    # Rescan logic to find modified/deleted files
+    # Load the DB once up front so per-file lookups are dict hits, not queries.
+    sha_index = db_utils.get_all_media_files(db_path)  # {sha: row}
+    path_index = {
+        entry["file_path"]: entry
+        for entry in sha_index.values()
+        if entry.get("file_path")
+    }
+
+    # Single filesystem pass: {rel_path: (abs_path, mtime, size)}
+    logging.info("Scanning filesystem for new or changed files...")
+    cached_dir_mtimes = None
+    if rescan and prune_unchanged_dirs:
+        cached_dir_mtimes = db_utils.get_dir_index(db_path)
+        for dir_rel in changed_dirs or ():
+            dir_rel = "" if dir_rel == "." else dir_rel
+            if dir_rel in cached_dir_mtimes:
+                # Keep the key so the walk still reaches the directory from
+                # its unchanged parent, but never match its mtime.
+                cached_dir_mtimes[dir_rel] = None
+    fs_entries, dir_mtimes = _scan_media_entries(
+        abs_storage_dir,
+        cached_dir_mtimes,
+        {
+            rel_path: (entry["last_modified"], entry.get("filesize"))
+            for rel_path, entry in path_index.items()
+        },
+    )
+
     if rescan:
         logging.info(f"Rescanning directory: {storage_dir} using DB: {db_path}")
-        db_file_entries = db_utils.get_all_media_files(db_path)
-        for sha256_hex, db_entry in db_file_entries.items():
-            rel_file_path = db_entry.get("file_path")
-            if not rel_file_path:
-                continue
-            abs_file_path_to_check = os.path.normpath(
-                os.path.join(abs_storage_dir, rel_file_path)
+        # Files known to the DB but gone from disk.
+        shas_to_delete = []
+        for rel_file_path in path_index.keys() - fs_entries.keys():
+            db_entry = path_index.pop(rel_file_path)
+            sha256_hex = db_entry["sha256_hex"]
+            logging.info(
+                f"File for SHA {sha256_hex} (path: {rel_file_path}) no longer exists. Removing from DB."
             )
-            processed_rel_file_paths.add(rel_file_path)
-
-            if not os.path.isfile(abs_file_path_to_check):
-                logging.info(
-                    f"File for SHA {sha256_hex} (path: {rel_file_path}) no longer exists. Removing from DB."
-                )
-                _delete_thumbnail_file(
-                    thumbnail_dir_abs, db_entry.get("thumbnail_file")
-                )
-                db_utils.delete_media_file_by_sha(db_path, sha256_hex)
-                continue
-
-            current_fs_last_modified = os.path.getmtime(abs_file_path_to_check)
-            db_last_modified = db_entry.get("last_modified")
-            if abs(current_fs_last_modified - db_last_modified) > 1e-6 or (
-                db_entry.get("tagging_model") != settings.tagging_model
-                and settings.tagging_model != "Off"
+            _delete_thumbnail_file(thumbnail_dir_abs, db_entry.get("thumbnail_file"))
+            existing_thumbnails.discard(db_entry.get("thumbnail_file"))
+            shas_to_delete.append(sha256_hex)
+            sha_index.pop(sha256_hex, None)
+        db_utils.delete_media_files_by_sha(db_path, shas_to_delete)
+
+        # New files, plus known files whose mtime changed or that need retagging.
+        retag = settings.tagging_model != "Off"
+        paths_to_process = fs_entries.keys() - path_index.keys()
+        for rel_file_path in fs_entries.keys() & path_index.keys():
+            db_entry = path_index[rel_file_path]
+            _, mtime, size = fs_entries[rel_file_path]
+            if not _is_db_entry_current(db_entry, mtime, size) or (
+                retag and db_entry.get("tagging_model") != settings.tagging_model
             ):
-                media_to_process.append(
-                    (
-                        abs_file_path_to_check,
-                        os.path.basename(rel_file_path),
-                        db_entry,
-                    )
-                )
-
-    # Filesystem walk for new files
-    logging.info("Scanning filesystem for new or changed files...")
-    for root, dirs, files in os.walk(abs_storage_dir):
-        if THUMBNAIL_DIR_NAME in dirs:
-            dirs.remove(THUMBNAIL_DIR_NAME)
-        for disk_filename in files:
-            abs_file_path = os.path.normpath(os.path.join(root, disk_filename))
-            rel_file_path = os.path.relpath(abs_file_path, abs_storage_dir)
-            if rel_file_path in processed_rel_file_paths and rescan:
-                continue
-            if is_media_file(abs_file_path):
-                db_entry_for_path = db_utils.get_media_file_by_path(
-                    db_path, rel_file_path
-                )
-                media_to_process.append((abs_file_path, disk_filename, db_entry_for_path))
-                processed_rel_file_paths.add(rel_file_path)
-
-    # Process all identified files
-    all_media_data = []
-    for abs_path, filename, db_entry in media_to_process:
-        sha = get_file_sha256(abs_path)
-        if sha:
-            data = _process_single_file(
+                paths_to_process.add(rel_file_path)
+    else:
+        paths_to_process = fs_entries.keys()
+
+    media_to_process = [
+        (
+            abs_file_path,
+            os.path.basename(rel_file_path),
+            path_index.get(rel_file_path),
+            mtime,
+            size,
+        )
+        for rel_file_path, (abs_file_path, mtime, size) in fs_entries.items()
+        if rel_file_path in paths_to_process
+    ]
+
+    # Process all identified files. Hashing dominates and hashlib releases the
+    # GIL, so files are handled concurrently; per-file DB lookups go through
+    # the preloaded sha_index rather than SQLite.
+    def process_file(item) -> Optional[Dict]:
+        abs_path, filename, db_entry, mtime, size = item
+        if db_entry is not None and _is_db_entry_current(db_entry, mtime, size):
+            # Same path, size and mtime as the stored row (e.g. only being
+            # retagged): trust its hash and metadata instead of re-reading.
+            return _process_single_file(
                 abs_storage_dir,
                 abs_path,
-                sha,
+                db_entry["sha256_hex"],
                 db_path,
                 thumbnail_dir_abs,
                 geolocator,
-                image_classifier,
                 settings,
                 filename,
                 db_entry,
+                sha_index,
+                reuse_metadata=True,
+                file_stat=(mtime, size),
+                existing_thumbnails=existing_thumbnails,
             )
-            if data:
-                all_media_data.append(data)
+        sha = get_file_hash(abs_path, fast=True, size=size)
+        if not sha:
+            return None
+        return _process_single_file(
+            abs_storage_dir,
+            abs_path,
+            sha,
+            db_path,
+            thumbnail_dir_abs,
+            geolocator,
+            settings,
+            filename,
+            db_entry,
+            sha_index,
+            file_stat=(mtime, size),
+            existing_thumbnails=existing_thumbnails,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        all_media_data = [
+            data for data in executor.map(process_file, media_to_process) if data
+        ]
 
-    # Thumbnail generation in parallel
+    # Tag images in batches: one forward pass per batch is far cheaper than
+    # one per image. Files with identical content are classified once.
+    media_to_tag = collections.defaultdict(list)  # {sha: [media_data]}
+    for media_data in all_media_data:
+        if media_data.pop("_needs_tagging", False):
+            media_to_tag[media_data["sha256_hex"]].append(media_data)
+    if media_to_tag:
+        shas_to_tag = list(media_to_tag)
+        all_tags = image_classifier.classify_images(
+            [media_to_tag[sha][0]["_abs_file_path"] for sha in shas_to_tag]
+        )
+        for sha, tags in zip(shas_to_tag, all_tags):
+            for media_data in media_to_tag[sha]:
+                media_data["tags"] = json.dumps(tags) if tags else None
+                media_data["tagging_model"] = settings.tagging_model if tags else None
+
+    # Thumbnails for images that were not opened above (e.g. unchanged files
+    # being retagged). Pillow releases the GIL while decoding, resizing and
+    # encoding, so threads avoid process startup and pickling.
     thumbnail_futures = {}
-    with concurrent.futures.ProcessPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
         for media_data in all_media_data:
             if media_data.get("_thumbnail_needed"):
                 future = executor.submit(
@@ -365,29 +1139,20 @@ def scan_directory(storage_dir: str, db_path: str, rescan: bool = False) -> None
                 f"Thumbnail generation failed for {media_data['_abs_file_path']}: {exc}"
             )
 
-    # Update database with all collected data
+    # Update database with all collected data, in a single transaction.
     for media_data in all_media_data:
         # Clean up temporary keys before DB insertion
         media_data.pop("_thumbnail_needed", None)
         media_data.pop("_abs_file_path", None)
-        db_utils.add_or_update_media_file(db_path, media_data)
+    db_utils.add_or_update_media_files(db_path, all_media_data)
 
-    # Cleanup phases
-    if rescan:
-        all_db_paths = db_utils.get_all_db_file_paths(db_path)
-        for db_rel_path in all_db_paths:
-            if db_rel_path not in processed_rel_file_paths:
-                entry_to_delete = db_utils.get_media_file_by_path(db_path, db_rel_path)
-                if entry_to_delete:
-                    _delete_thumbnail_file(
-                        thumbnail_dir_abs, entry_to_delete.get("thumbnail_file")
-                    )
-                    db_utils.delete_media_file_by_sha(
-                        db_path, entry_to_delete["sha256_hex"]
-                    )
+    db_utils.replace_dir_index(db_path, dir_mtimes)
+
+    # Cleanup phase. Uploads may have been added while the scan ran, so both
+    # the cleanup and the final count read the table again.
     _cleanup_orphaned_thumbnails(db_path, thumbnail_dir_abs)
 
-    media_count = len(db_utils.get_all_media_files(db_path))
+    media_count = db_utils.count_media_files(db_path)
     logging.info(f"Scan complete. Database contains {media_count} media files.")
 
 
@@ -401,24 +1166,46 @@ def _process_single_file(
     db_path: str,
     thumbnail_dir_abs: str,
     geolocator: GeoLocator,
-    image_classifier: ImageClassifier,
     settings: SettingsManager,
     disk_filename: str,
     existing_db_entry_for_path: Optional[Dict] = None,
+    sha_index: Optional[Dict[str, Dict]] = None,
+    reuse_metadata: bool = False,
+    file_stat: Optional[Tuple[float, int]] = None,
+    existing_thumbnails: Optional[Set[str]] = None,
 ) -> Optional[Dict]:
     """
     Helper to process a single media file, returning its metadata dictionary.
-    This version does NOT generate the thumbnail itself but returns info to do so.
+    Images opened for their metadata also get their thumbnail generated from
+    the same decoder; otherwise `_thumbnail_needed` asks the caller to do it.
+    Images to be (re)tagged are flagged with `_needs_tagging` so the caller
+    can classify them in batches.
+
+    If `sha_index` (a preloaded {sha: row} mapping of the DB) is given, the
+    existing entry for the SHA is looked up there instead of querying SQLite.
+    If `reuse_metadata` is True, the file is known to be unchanged since
+    `existing_db_entry_for_path` was stored, so its dimensions, dates and
+    location are copied from that row instead of being read from the image.
+    The same happens for an image whose SHA already has a row with a
+    thumbnail on disk, since identical content has identical metadata.
+    If `file_stat` ((mtime, size), as collected by the directory scan) is
+    given, the file is not stat'ed again for them. Likewise
+    `existing_thumbnails` (thumbnail paths listed at the start of the scan)
+    replaces per-file existence checks on the thumbnail directory.
     """
     rel_file_path = os.path.relpath(abs_file_path, abs_storage_dir)
-    logging.debug(f"Processing details for: {rel_file_path} (SHA: {sha256_hex})")
+    logging.debug("Processing details for: %s (SHA: %s)", rel_file_path, sha256_hex)
 
-    mime_type, _ = mimetypes.guess_type(abs_file_path)
-    filesize = os.path.getsize(abs_file_path)
+    mime_type = guess_mime_type(abs_file_path)
     tags = None
+    needs_tagging = False
     thumbnail_needed = False
+    thumbnail_file = None
 
-    existing_entry_for_sha = db_utils.get_media_file_by_sha(db_path, sha256_hex)
+    if sha_index is not None:
+        existing_entry_for_sha = sha_index.get(sha256_hex)
+    else:
+        existing_entry_for_sha = db_utils.get_media_file_by_sha(db_path, sha256_hex)
 
     if mime_type and mime_type.startswith("image/"):
         thumbnail_needed = True  # Mark that a thumbnail is needed
@@ -432,7 +1219,7 @@ def _process_single_file(
             settings.tagging_model != "Off"
             and settings.tagging_model != tagging_model_in_db
         ):
-            tags = image_classifier.classify_image(abs_file_path)
+            needs_tagging = True  # Classified in batches by scan_directory
         elif existing_entry_for_sha:
             tags = (
                 json.loads(existing_entry_for_sha.get("tags"))
@@ -441,48 +1228,89 @@ def _process_single_file(
             )
 
     try:
-        last_modified = os.path.getmtime(abs_file_path)
-        filesystem_creation_time = os.path.getctime(abs_file_path)
-        original_creation_date = filesystem_creation_time
+        stat_result = None
+        if file_stat is not None:
+            last_modified, filesize = file_stat
+        else:
+            stat_result = os.stat(abs_file_path)
+            last_modified, filesize = stat_result.st_mtime, stat_result.st_size
+        original_creation_date = None
         image_width, image_height = None, None
         latitude, longitude, city, country = None, None, None, None
 
-        if mime_type and mime_type.startswith("image/"):
+        metadata_source = None
+        if reuse_metadata and existing_db_entry_for_path:
+            metadata_source = existing_db_entry_for_path
+            _, expected_thumbnail = _thumbnail_paths(thumbnail_dir_abs, sha256_hex)
+            if thumbnail_needed and _thumbnail_exists(
+                thumbnail_dir_abs, expected_thumbnail, existing_thumbnails
+            ):
+                thumbnail_file = expected_thumbnail
+                thumbnail_needed = False
+        elif (
+            existing_entry_for_sha
+            and existing_entry_for_sha.get("width") is not None
+            and existing_entry_for_sha.get("thumbnail_file")
+            and _thumbnail_exists(
+                thumbnail_dir_abs,
+                existing_entry_for_sha["thumbnail_file"],
+                existing_thumbnails,
+            )
+        ):
+            # Same content as an already processed image (e.g. a moved or
+            # touched file): its metadata and thumbnail are still valid, so
+            # the image does not need to be opened at all.
+            metadata_source = existing_entry_for_sha
+            thumbnail_file = existing_entry_for_sha["thumbnail_file"]
+            thumbnail_needed = False
+
+        if metadata_source is not None:
+            original_creation_date = metadata_source.get("original_creation_date")
+            image_width = metadata_source.get("width")
+            image_height = metadata_source.get("height")
+            latitude = metadata_source.get("latitude")
+            longitude = metadata_source.get("longitude")
+            city = metadata_source.get("city")
+            country = metadata_source.get("country")
+        elif mime_type and mime_type.startswith("image/"):
             try:
                 with Image.open(abs_file_path) as img:
                     image_width, image_height = img.size
-                    exif_data = img.getexif()
-                    if exif_data:
-                        date_time_original_tag, date_time_tag = 36867, 306
-                        exif_date_str = exif_data.get(
-                            date_time_original_tag
-                        ) or exif_data.get(date_time_tag)
-                        if exif_date_str:
-                            try:
-                                dt_object = datetime.strptime(
-                                    exif_date_str, "%Y:%m:%d %H:%M:%S"
-                                )
-                                original_creation_date = dt_object.timestamp()
-                            except (ValueError, TypeError):
-                                logging.warning(
-                                    f"Malformed EXIF date string '{exif_date_str}' in {abs_file_path}."
-                                )
-                        parsed_lat, parsed_lon = _get_gps_coordinates_from_exif(
-                            exif_data
+                    exif_date_str, latitude, longitude = _read_exif_fields(img)
+                    # Thumbnail from the same decoder rather than reopening
+                    # the file in a separate pass.
+                    _, thumbnail_file = _thumbnail_paths(thumbnail_dir_abs, sha256_hex)
+                    if not _thumbnail_exists(
+                        thumbnail_dir_abs, thumbnail_file, existing_thumbnails
+                    ):
+                        thumbnail_file = generate_thumbnail_from_image(
+                            img, thumbnail_dir_abs, sha256_hex
                         )
-                        if parsed_lat is not None:
-                            latitude = parsed_lat
-                        if parsed_lon is not None:
-                            longitude = parsed_lon
-                        if latitude and longitude:
-                            closest_city = geolocator.nearest_city(latitude, longitude)
-                            if closest_city:
-                                city, country = closest_city.name, closest_city.country
+                    thumbnail_needed = False
+                if exif_date_str:
+                    try:
+                        dt_object = parse_exif_datetime(exif_date_str)
+                        original_creation_date = dt_object.timestamp()
+                    except (ValueError, TypeError):
+                        logging.warning(
+                            f"Malformed EXIF date string '{exif_date_str}' in {abs_file_path}."
+                        )
+                if latitude and longitude:
+                    closest_city = geolocator.nearest_city(latitude, longitude)
+                    if closest_city:
+                        city, country = closest_city.name, closest_city.country
             except Exception as exif_e:
                 logging.warning(
                     f"Could not read metadata for {abs_file_path}: {exif_e}."
                 )
 
+        if original_creation_date is None:
+            # No capture date: fall back to the filesystem's creation time,
+            # which costs a stat only for files without one.
+            if stat_result is None:
+                stat_result = os.stat(abs_file_path)
+            original_creation_date = stat_result.st_ctime
+
         original_filename = disk_filename
         if existing_entry_for_sha:
             original_filename = existing_entry_for_sha.get(
@@ -498,7 +1326,7 @@ def _process_single_file(
             "file_path": rel_file_path,
             "last_modified": last_modified,
             "original_creation_date": original_creation_date,
-            "thumbnail_file": None,  # Will be filled in later
+            "thumbnail_file": thumbnail_file,
             "width": image_width,
             "height": image_height,
             "latitude": latitude,
@@ -509,8 +1337,11 @@ def _process_single_file(
             "filesize": filesize,
             "tags": json.dumps(tags) if tags else None,
             "tagging_model": settings.tagging_model if tags else None,
-            # Add a temporary flag for the main scanner function
+            "hash_algo": HASH_ALGO,
+            "hash_mode": _get_hash_mode(mime_type, filesize),
+            # Add temporary flags for the main scanner function
             "_thumbnail_needed": thumbnail_needed,
+            "_needs_tagging": needs_tagging,
             "_abs_file_path": abs_file_path,
         }
         return media_data
@@ -525,12 +1356,20 @@ def _process_single_file(
 
 
 def _cleanup_orphaned_thumbnails(db_path: str, thumbnail_dir_abs: str):
-    """Removes thumbnail files that are not referenced in the database."""
+    """
+    Removes thumbnail files that are not referenced in the database.
+
+    The directory is listed before the database is read. An upload stores its
+    row before writing its thumbnail, so any thumbnail found on disk already
+    has a row by then; its canonical path is kept even while the row's
+    `thumbnail_file` is still unset.
+    """
     if not os.path.exists(thumbnail_dir_abs):
         logging.debug("Thumbnail directory does not exist, no cleanup needed.")
         return
 
     logging.info(f"Cleaning orphaned thumbnails in {thumbnail_dir_abs}...")
+    on_disk_thumb_rel_paths, subdirs = _list_thumbnail_files(thumbnail_dir_abs)
     db_thumbnails = db_utils.get_all_shas_and_thumbnails(
         db_path
     )  # {sha: thumbnail_rel_path}
@@ -538,42 +1377,38 @@ def _cleanup_orphaned_thumbnails(db_path: str, thumbnail_dir_abs: str):
     expected_thumb_rel_paths = {
         thumb_path for thumb_path in db_thumbnails.values() if thumb_path
     }
+    expected_thumb_rel_paths.update(
+        _thumbnail_paths(thumbnail_dir_abs, sha)[1] for sha in db_thumbnails
+    )
 
-    cleaned_count = 0
-    # Walk through the thumbnail directory structure (e.g., .thumbnails/ab/hash.png)
-    for root, dirs, files in os.walk(
-        thumbnail_dir_abs, topdown=False
-    ):  # topdown=False for rmdir
-        for file_name in files:
-            if file_name.endswith(THUMBNAIL_EXTENSION):
-                # Construct the relative path of the thumbnail on disk
-                # root is like /path/to/.thumbnails/ab, file_name is hash.png
-                # We need 'ab/hash.png' to compare with expected_thumb_rel_paths
-                thumb_on_disk_rel_path = os.path.relpath(
-                    os.path.join(root, file_name), thumbnail_dir_abs
-                )
+    orphaned_thumb_rel_paths = on_disk_thumb_rel_paths - expected_thumb_rel_paths
 
-                if thumb_on_disk_rel_path not in expected_thumb_rel_paths:
-                    orphaned_thumb_path_abs = os.path.join(root, file_name)
-                    try:
-                        os.remove(orphaned_thumb_path_abs)
-                        logging.info(
-                            f"Removed orphaned thumbnail: {orphaned_thumb_path_abs}"
-                        )
-                        cleaned_count += 1
-                    except OSError as e:
-                        logging.error(
-                            f"Error removing orphaned thumbnail {orphaned_thumb_path_abs}: {e}"
-                        )
+    def remove_orphan(thumb_rel_path: str) -> bool:
+        orphaned_thumb_path_abs = os.path.join(thumbnail_dir_abs, thumb_rel_path)
+        try:
+            os.remove(orphaned_thumb_path_abs)
+            logging.info(f"Removed orphaned thumbnail: {orphaned_thumb_path_abs}")
+            return True
+        except OSError as e:
+            logging.error(
+                f"Error removing orphaned thumbnail {orphaned_thumb_path_abs}: {e}"
+            )
+            return False
 
-        # After removing files in a directory, if the directory is empty, remove it
-        # This applies only to subdirectories (e.g. .thumbnails/ab), not the main .thumbnails dir
-        if root != thumbnail_dir_abs and not os.listdir(root):
+    cleaned_count = 0
+    if orphaned_thumb_rel_paths:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            cleaned_count = sum(executor.map(remove_orphan, orphaned_thumb_rel_paths))
+
+    # Remove prefix subdirectories (e.g. .thumbnails/ab) left empty, but never
+    # the main .thumbnails dir itself.
+    for subdir in subdirs:
+        if not os.listdir(subdir):
             try:
-                os.rmdir(root)
-                logging.info(f"Removed empty thumbnail subdirectory: {root}")
+                os.rmdir(subdir)
+                logging.info(f"Removed empty thumbnail subdirectory: {subdir}")
             except OSError as e:
                 logging.error(
-                    f"Error removing empty thumbnail subdirectory {root}: {e}"
+                    f"Error removing empty thumbnail subdirectory {subdir}: {e}"
                 )
     logging.info(f"Orphaned thumbnail cleanup complete. Removed {cleaned_count} files.")
@@ -10,29 +10,61 @@ if __name__ == "__main__" and __package__ is None:
     if PROJECT_ROOT_FOR_SERVER not in sys.path:
         sys.path.insert(0, PROJECT_ROOT_FOR_SERVER)
 
+import atexit
+import collections
+import concurrent.futures
 import dataclasses
+import gzip
 import threading
 import time
 import datetime
+import tempfile
 import hashlib
-import mimetypes  # for guessing mime type of uploaded file
-from werkzeug.utils import secure_filename
+import logging as python_logging
+import queue
+import re
+import sqlite3
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import quote, urlencode
+from typing import Optional, Set
+
+try:
+    import orjson as _orjson  # Optional, faster JSON encoding
+except ImportError:
+    _orjson = None
+
+try:
+    import waitress  # Optional, production WSGI server
+except ImportError:
+    waitress = None
+
+from PIL import Image as PILImage
+from werkzeug.utils import safe_join, secure_filename
 from werkzeug.exceptions import NotFound
+from flask.json.provider import DefaultJSONProvider
 from flask import request, g as flask_g  # Added g for db connection per request
 
 from absl import app as absl_app
 from absl import flags, logging
-from flask import Flask, jsonify, abort, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    abort,
+    send_file,
+)
 
 # Correctly import from the same package
 try:
     from . import media_scanner
     from . import database as db_utils
     from . import settings as settings_utils
+    from . import watcher
 except ImportError:
     from media_server import media_scanner  # Fallback for direct execution
     from media_server import database as db_utils
     from media_server import settings as settings_utils
+    from media_server import watcher
 
 
 FLAGS = flags.FLAGS
@@ -44,6 +76,63 @@ try:
     flags.DEFINE_string(
         "db_name", db_utils.DATABASE_NAME, "Name of the SQLite database file."
     )
+    flags.DEFINE_enum(
+        "hash_algo",
+        media_scanner.HASH_ALGO,
+        list(media_scanner.SUPPORTED_HASH_ALGOS),
+        "Content hash used to identify media. 'blake3' needs the blake3 package.",
+    )
+    flags.DEFINE_bool(
+        "sparse_video_hash",
+        False,
+        "Identify large videos by a head/tail/size fingerprint instead of a full hash.",
+    )
+    flags.DEFINE_bool(
+        "prune_unchanged_dirs",
+        False,
+        "On background rescans, skip listing directories whose mtime is unchanged. "
+        "Faster for large libraries, but files edited in place are not picked up.",
+    )
+    flags.DEFINE_string(
+        "x_accel_redirect_prefix",
+        None,
+        "When serving behind nginx, an internal location mapped to storage_dir "
+        "(e.g. /_protected). Images and thumbnails are then sent by nginx via "
+        "X-Accel-Redirect instead of through Python.",
+    )
+    flags.DEFINE_integer(
+        "max_upload_mb",
+        4096,
+        "Largest accepted upload, in MiB; larger uploads get 413. 0 for no limit.",
+    )
+    flags.DEFINE_bool(
+        "watch_storage_dir",
+        False,
+        "Rescan shortly after media in storage_dir changes, using inotify "
+        "(Linux, needs the inotify_simple package).",
+    )
+    flags.DEFINE_enum(
+        "http_server",
+        "auto",
+        ["auto", "waitress", "flask"],
+        "HTTP server to run. 'auto' uses waitress when it is installed and "
+        "falls back to Flask's built-in server.",
+    )
+    flags.DEFINE_integer(
+        "server_threads",
+        16,
+        "Worker threads for the waitress server.",
+    )
+    flags.DEFINE_integer(
+        "thumbnail_cache_mb",
+        64,
+        "Memory for keeping recently served thumbnails, in MiB. 0 disables it.",
+    )
+    flags.DEFINE_bool(
+        "use_x_sendfile",
+        False,
+        "Send images and thumbnails via the X-Sendfile header (Apache, lighttpd).",
+    )
     if (
         __name__ == "__main__"
     ):  # Mark as required only if this script is the entry point
@@ -56,7 +145,55 @@ except flags.Error:
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 WEB_DIR_ABSOLUTE = os.path.join(PROJECT_ROOT, "web")
 
+# A hex-encoded SHA256, as accepted by the image and thumbnail routes.
+SHA256_HEX_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+# The last /list body, as (db_signature, json_bytes, gzipped_bytes); see
+# _get_cached_media_list.
+_list_cache = None
+_list_cache_lock = threading.Lock()
+
+# Largest page a client may request from /list?limit=.
+MAX_LIST_PAGE_SIZE = 5000
+
+# Cache-Control max-age, in seconds, for images and thumbnails. Both are
+# addressed by content hash, so a response for a given URL never changes and
+# is marked immutable: clients need not revalidate it.
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Recently served thumbnails, {sha: png bytes} in LRU order, holding at most
+# THUMBNAIL_CACHE_BYTES (app config) bytes; see _read_thumbnail.
+_thumbnail_cache = collections.OrderedDict()
+_thumbnail_cache_bytes = 0
+_thumbnail_cache_lock = threading.Lock()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with the C-backed orjson package.
+
+    Keys are sorted and NaN/Infinity become null; otherwise the output
+    matches the default provider for the plain dicts this server returns.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj):
+        """Encodes `obj` straight to UTF-8 JSON bytes."""
+        return _orjson.dumps(obj, option=_orjson.OPT_SORT_KEYS)
+
+    def loads(self, s, **kwargs):
+        return _orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder=WEB_DIR_ABSOLUTE, static_url_path="")
+if _orjson is not None:
+    app.json = OrjsonProvider(app)
 
 
 # --- Database Connection Handling ---
@@ -97,25 +234,104 @@ def get_db():
 @app.teardown_appcontext
 def close_db(error):
     """
-    Closes the database connection at the end of the request.
+    Releases the database connection at the end of the request.
 
     This function is registered with Flask's `teardown_appcontext` and is
-    automatically called when the application context is popped.
+    automatically called when the application context is popped. The
+    connection goes back to the idle pool for the next request thread.
 
     Args:
         error: An exception that occurred during the request, if any.
     """
+    db_utils.release_db_connection()  # This uses thread_local.connection
     if hasattr(flask_g, "sqlite_db"):
-        db_utils.close_db_connection()  # This uses thread_local.connection
         delattr(flask_g, "sqlite_db")  # Remove from flask_g
 
 
 # --- Background Scanner ---
 scanner_wakeup_event = threading.Event()
+# Set to make the background scanner exit once any scan in progress is done.
+scanner_stop_event = threading.Event()
+# Set when the storage directory watcher saw changes; the scanner then rescans
+# even if periodic rescanning is disabled.
+rescan_requested_event = threading.Event()
+# Absolute paths of the directories changed since the last requested rescan,
+# or None if a full rescan was requested. Guarded by _rescan_request_lock.
+_requested_changed_dirs: Optional[Set[str]] = set()
+_rescan_request_lock = threading.Lock()
+
+
+def request_rescan(changed_dirs=None):
+    """
+    Asks the background scanner to rescan as soon as possible.
+
+    Args:
+        changed_dirs: Absolute paths of the directories that changed. Only
+            these (and directories whose mtime changed) are listed again. If
+            None, the whole storage directory is rescanned.
+    """
+    global _requested_changed_dirs
+    with _rescan_request_lock:
+        if changed_dirs is None or _requested_changed_dirs is None:
+            _requested_changed_dirs = None
+        else:
+            _requested_changed_dirs.update(changed_dirs)
+        rescan_requested_event.set()
+    scanner_wakeup_event.set()
+
+
+def stop_background_scanner():
+    """
+    Asks the background scanner to exit, waking it if it is waiting.
+    """
+    scanner_stop_event.set()
+    scanner_wakeup_event.set()
+
+
+def _take_rescan_request():
+    """
+    Consumes the pending rescan request, if any.
+
+    Returns:
+        A tuple of whether a rescan was requested and the changed directories
+        (None for a full rescan).
+    """
+    global _requested_changed_dirs
+    with _rescan_request_lock:
+        requested = rescan_requested_event.is_set()
+        rescan_requested_event.clear()
+        changed_dirs = _requested_changed_dirs
+        _requested_changed_dirs = set()
+    return requested, changed_dirs
+
+
+def initial_scan(storage_dir, db_path):
+    """
+    Runs the startup scan, which processes every media file.
+
+    Args:
+        storage_dir: The storage directory.
+        db_path: The path to the database file.
+    """
+    logging.info(f"Performing initial scan of storage directory: {storage_dir}")
+    try:
+        media_scanner.scan_directory(storage_dir, db_path, rescan=False)
+    except Exception as e:
+        logging.error(f"Error during initial scan: {e}", exc_info=True)
+        # Decide if server should start if initial scan fails. For now, it will.
+    finally:
+        db_utils.close_db_connection()  # Close connection for this thread after scan
+
+    warm_list_cache(db_path)
+    num_items_in_db = db_utils.count_media_files(db_path)
+    logging.info(f"Initial scan complete. Database contains {num_items_in_db} items.")
+    db_utils.close_db_connection()
 
 
 def background_scanner_task(
-    app_context, settings_manager_instance: settings_utils.SettingsManager
+    app_context,
+    settings_manager_instance: settings_utils.SettingsManager,
+    run_initial_scan: bool = False,
 ):
     """
     A background task that periodically rescans the storage directory.
@@ -126,6 +342,8 @@ def background_scanner_task(
     Args:
         app_context: The Flask application context.
         settings_manager_instance: An instance of the SettingsManager.
+        run_initial_scan: Whether to run the startup scan first, while the
+            server is already serving the existing library.
     """
     # Background thread needs to manage its own DB connection via db_utils.thread_local
     # It doesn't use flask_g.
@@ -145,9 +363,11 @@ def background_scanner_task(
         logging.info(
             f"Background scanner started for dir: {storage_dir}, DB: {db_path}"
         )
-        while True:
+        if run_initial_scan:
+            initial_scan(storage_dir, db_path)
+        while not scanner_stop_event.is_set():
             rescan_interval = settings_manager_instance.get().rescan_interval
-            if rescan_interval <= 0:
+            if rescan_interval <= 0 and not rescan_requested_event.is_set():
                 logging.info(
                     "Rescanning is disabled, scanner will sleep until settings change."
                 )
@@ -156,26 +376,60 @@ def background_scanner_task(
                 logging.info("Scanner woken up by settings change.")
                 continue
 
+            requested, changed_dirs = _take_rescan_request()
+            incremental = requested and changed_dirs is not None
             try:
                 # The db_utils.get_db_connection() called by media_scanner will use thread_local
                 # to get/create a connection for this background thread.
-                logging.info(
-                    f"Background scanner performing rescan... (Interval: {rescan_interval}s)"
-                )
-                media_scanner.scan_directory(storage_dir, db_path, rescan=True)
+                if incremental:
+                    # Only the directories the watcher saw change are listed;
+                    # the rest are pruned by mtime.
+                    logging.info(
+                        f"Background scanner rescanning {len(changed_dirs)} changed directories..."
+                    )
+                    media_scanner.scan_directory(
+                        storage_dir,
+                        db_path,
+                        rescan=True,
+                        prune_unchanged_dirs=True,
+                        changed_dirs=[
+                            os.path.relpath(d, storage_dir) for d in changed_dirs
+                        ],
+                    )
+                else:
+                    logging.info(
+                        f"Background scanner performing rescan... (Interval: {rescan_interval}s)"
+                    )
+                    media_scanner.scan_directory(
+                        storage_dir,
+                        db_path,
+                        rescan=True,
+                        prune_unchanged_dirs=app.config.get(
+                            "PRUNE_UNCHANGED_DIRS", False
+                        ),
+                    )
                 logging.info("Background rescan complete.")
+                clear_thumbnail_cache()
+                warm_list_cache(db_path)
             except Exception as e:
                 logging.error(f"Error during background scan: {e}", exc_info=True)
             finally:
                 # Ensure connection for this thread is closed after each scan cycle
                 db_utils.close_db_connection()
 
-            # Fetch interval again in case it was changed during the scan
-            current_interval = settings_manager_instance.get().rescan_interval
-            if current_interval > 0:
-                logging.debug(f"Scanner sleeping for {current_interval} seconds.")
-                scanner_wakeup_event.wait(timeout=current_interval)
+            # Sleep until the next scan is due. The interval is re-read on
+            # every wakeup, so a changed setting reschedules the next scan
+            # relative to the last one instead of waiting out the old interval.
+            last_scan_end = time.monotonic()
+            while not (scanner_stop_event.is_set() or rescan_requested_event.is_set()):
+                current_interval = settings_manager_instance.get().rescan_interval
+                remaining = last_scan_end + current_interval - time.monotonic()
+                if current_interval <= 0 or remaining <= 0:
+                    break
+                logging.debug(f"Scanner sleeping for {remaining:.0f} seconds.")
+                scanner_wakeup_event.wait(timeout=remaining)
                 scanner_wakeup_event.clear()
+        logging.info("Background scanner stopped.")
 
 
 # --- Flask Routes ---
@@ -193,22 +447,200 @@ def root():
 @app.route("/list", methods=["GET"])
 def list_media():
     """
-    Returns a list of all media files in the database.
+    Returns media files in the database.
+
+    Without query parameters the whole library is returned from a payload
+    that is serialized once per database state and rebuilt after scans. With
+    `limit` (and optionally `after_ts` and `after_sha` from the previous
+    page's `X-Next-Page` header), one page of at most `limit` items is
+    returned, newest first. Responses carry a weak ETag that changes with the
+    database, and a matching If-None-Match gets a 304 without any query.
+
+    Returns:
+        A JSON response containing a dictionary of media files keyed by SHA256.
+    """
+    db_path = app.config["DATABASE_PATH"]
+    db_signature = _db_signature(db_path)
+    etag = _list_etag(db_signature)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    response = _list_media_response(db_path, db_signature)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def _db_signature(db_path):
+    """
+    Returns a string that changes whenever the media table changes.
+
+    It is derived from the database's in-process write generation and the
+    size and modification time of the database file (and its write-ahead
+    log, if any), so it changes whenever a write is committed, without
+    querying the database. The file stats catch writes from other processes.
+
+    Args:
+        db_path: The path to the database file.
+
+    Returns:
+        The signature string.
+    """
+    parts = [str(db_utils.get_media_generation())]
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{st.st_mtime_ns}-{st.st_size}")
+    return "-".join(parts)
+
+
+def _list_etag(db_signature):
+    """
+    Returns an ETag for the current /list request.
+
+    Every full listing has the same body for a database state, whatever else
+    is in the query string, so only paginated requests add the query to the
+    tag.
+
+    Args:
+        db_signature: The database's current `_db_signature`.
+
+    Returns:
+        The ETag value, without quotes.
+    """
+    if "limit" not in request.args:
+        return db_signature
+    return f"{db_signature}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+
+
+def _get_cached_media_list(db_path, db_signature):
+    """
+    Returns the JSON body of the full /list response, plain and gzipped.
+
+    The body is encoded and compressed once per database state, identified
+    by `db_signature`, and reused until the database changes, so repeated
+    requests cost neither a query nor any serialization.
+
+    Args:
+        db_path: The path to the database file.
+        db_signature: The database's current `_db_signature`.
+
+    Returns:
+        A tuple of the JSON document and its gzip-compressed form.
+
+    Raises:
+        sqlite3.Error: If the database cannot be read. Nothing is cached then.
+    """
+    global _list_cache
+    # Readers take a reference to the published tuple without locking; the
+    # lock only serializes rebuilds, which replace the tuple in one rebind.
+    cached = _list_cache
+    if cached is not None and cached[0] == db_signature:
+        return cached[1], cached[2]
+    with _list_cache_lock:
+        if _list_cache is None or _list_cache[0] != db_signature:
+            payload = b"".join(
+                _stream_media_dict(db_utils.iter_all_media_files(db_path))
+            )
+            _list_cache = (
+                db_signature,
+                payload,
+                gzip.compress(payload, compresslevel=6),
+            )
+            logging.info(
+                f"Rebuilt /list cache: {len(payload)} bytes, {len(_list_cache[2])} gzipped."
+            )
+        return _list_cache[1], _list_cache[2]
+
+
+def warm_list_cache(db_path):
+    """
+    Rebuilds the cached /list body, e.g. right after a scan.
+
+    Args:
+        db_path: The path to the database file.
+    """
+    try:
+        _get_cached_media_list(db_path, _db_signature(db_path))
+    except sqlite3.Error as e:
+        logging.error(f"Could not build the /list cache: {e}")
+
+
+def _list_media_response(db_path, db_signature):
+    """
+    Builds the /list response for the current request's query parameters.
+
+    Args:
+        db_path: The path to the database file.
+        db_signature: The database's current `_db_signature`.
 
     Returns:
-        A JSON response containing a dictionary of all media files.
+        A Flask response.
     """
-    # get_db() will be called implicitly by db_utils if using flask_g,
-    # or db_utils manages its own thread_local connection.
-    # For request context, get_db() here ensures flask_g.sqlite_db is set.
-    # db_conn_for_request = get_db() # Establishes flask_g.sqlite_db if not present
+    if "limit" not in request.args:
+        try:
+            payload, gzipped = _get_cached_media_list(db_path, db_signature)
+        except sqlite3.Error:
+            abort(500, description="Failed to read the media list.")
+        if "gzip" in request.accept_encodings:
+            logging.debug("Serving /list request from the cache (gzip).")
+            response = Response(gzipped, mimetype="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            logging.debug("Serving /list request from the cache.")
+            response = Response(payload, mimetype="application/json")
+        response.vary.add("Accept-Encoding")
+        return response
+
+    try:
+        limit = int(request.args["limit"])
+        after_ts = request.args.get("after_ts")
+        after_sha = request.args.get("after_sha")
+        if not 0 < limit <= MAX_LIST_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_LIST_PAGE_SIZE}")
+        if (after_ts is None) != (after_sha is None):
+            raise ValueError("after_ts and after_sha must be given together")
+        after = (float(after_ts), after_sha) if after_ts is not None else None
+    except ValueError as e:
+        abort(400, description=f"Invalid pagination parameters: {e}")
+
+    page = db_utils.get_media_files_page(db_path, limit, after)
+    logging.debug(f"Served /list page request, found {len(page)} items.")
+    response = jsonify({item["sha256_hex"]: item for item in page})
+    if len(page) == limit:
+        last = page[-1]
+        response.headers["X-Next-Page"] = urlencode(
+            {
+                "limit": limit,
+                "after_ts": repr(last["original_creation_date"]),
+                "after_sha": last["sha256_hex"],
+            }
+        )
+    return response
 
-    # db_utils functions now use app.config['DATABASE_PATH'] via their own get_db_path if flask_g not set,
-    # or directly use the connection from flask_g if set by get_db().
-    # The crucial part is that db_utils.get_db_connection gets the correct db_path.
-    all_media = db_utils.get_all_media_files(app.config["DATABASE_PATH"])
-    logging.info(f"Served /list request, found {len(all_media)} items.")
-    return jsonify(all_media)
+
+def _stream_media_dict(media_items):
+    """
+    Yields the JSON encoding of a SHA256-keyed dictionary of media items.
+
+    Args:
+        media_items: An iterable of media file metadata dictionaries.
+
+    Yields:
+        Successive UTF-8 encoded fragments of the JSON document.
+    """
+    dumps_bytes = getattr(app.json, "dumps_bytes", None) or (
+        lambda obj: app.json.dumps(obj).encode()
+    )
+    yield b"{"
+    separator = b""
+    for item in media_items:
+        yield separator + dumps_bytes(item["sha256_hex"]) + b": " + dumps_bytes(item)
+        separator = b", "
+    yield b"}"
 
 
 @app.route("/list/date/<string:date_str>", methods=["GET"])
@@ -218,52 +650,61 @@ def list_media_by_date(date_str):
     Date format should be YYYY-MM-DD.
     """
     try:
-        # Convert YYYY-MM-DD string to a datetime object, then to a timestamp
-        dt_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        # To get a full day, we can find the start and end of the day.
-        # However, the DB function get_media_files_by_date uses date() SQL function,
-        # so passing the timestamp of the beginning of the day is sufficient.
-        timestamp = dt_obj.timestamp()
-        media_files = db_utils.get_media_files_by_date(
-            app.config["DATABASE_PATH"], timestamp
-        )
-        logging.info(
-            f"Served /list/date/{date_str} request, found {len(media_files)} items."
-        )
-        return jsonify(media_files)
+        day = datetime.date.fromisoformat(date_str)
     except ValueError:
         abort(400, description="Invalid date format. Please use YYYY-MM-DD.")
 
+    media_files = db_utils.get_media_files_in_range(
+        app.config["DATABASE_PATH"], *_local_day_bounds(day, day)
+    )
+    logging.debug(
+        f"Served /list/date/{date_str} request, found {len(media_files)} items."
+    )
+    return jsonify(media_files)
+
 
 @app.route(
     "/list/daterange/<string:start_date_str>/<string:end_date_str>", methods=["GET"]
 )
 def list_media_by_date_range(start_date_str, end_date_str):
     """
-    Lists media files within a date range.
+    Lists media files within a date range, including both end dates.
     Date format should be YYYY-MM-DD.
     """
     try:
-        start_dt = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
-        end_dt = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
-        # To be inclusive of the end date, set time to end of day
-        end_dt = end_dt.replace(hour=23, minute=59, second=59)
+        start_day = datetime.date.fromisoformat(start_date_str)
+        end_day = datetime.date.fromisoformat(end_date_str)
+    except ValueError:
+        abort(400, description="Invalid date format. Please use YYYY-MM-DD.")
 
-        start_timestamp = start_dt.timestamp()
-        end_timestamp = end_dt.timestamp()
+    if start_day > end_day:
+        abort(400, description="Start date must be before end date.")
 
-        if start_timestamp > end_timestamp:
-            abort(400, description="Start date must be before end date.")
+    media_files = db_utils.get_media_files_in_range(
+        app.config["DATABASE_PATH"], *_local_day_bounds(start_day, end_day)
+    )
+    logging.debug(
+        f"Served /list/daterange/ request from {start_date_str} to {end_date_str}, found {len(media_files)} items."
+    )
+    return jsonify(media_files)
 
-        media_files = db_utils.get_media_files_by_date_range(
-            app.config["DATABASE_PATH"], start_timestamp, end_timestamp
-        )
-        logging.info(
-            f"Served /list/daterange/ request from {start_date_str} to {end_date_str}, found {len(media_files)} items."
-        )
-        return jsonify(media_files)
-    except ValueError:
-        abort(400, description="Invalid date format. Please use YYYY-MM-DD.")
+
+def _local_day_bounds(first_day, last_day):
+    """
+    Returns the half-open timestamp range covering whole local days.
+
+    Args:
+        first_day: The first day in the range, as a `datetime.date`.
+        last_day: The last day in the range, inclusive.
+
+    Returns:
+        A tuple of (start timestamp, end timestamp), where the end is the
+        start of the day after `last_day`.
+    """
+    midnight = datetime.time()
+    start = datetime.datetime.combine(first_day, midnight)
+    end = datetime.datetime.combine(last_day + datetime.timedelta(days=1), midnight)
+    return start.timestamp(), end.timestamp()
 
 
 @app.route("/list/location/<string:city>", methods=["GET"])
@@ -276,7 +717,7 @@ def list_media_by_location(city, country=None):
         app.config["DATABASE_PATH"], city, country
     )
     location_str = f"{city}/{country}" if country else city
-    logging.info(
+    logging.debug(
         f"Served /list/location/{location_str} request, found {len(media_files)} items."
     )
     return jsonify(media_files)
@@ -298,14 +739,147 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# Reads metadata and generates thumbnails for uploaded images and flushes
+# uploads to disk, so uploads return without waiting for either.
+_upload_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=os.cpu_count(), thread_name_prefix="upload"
+)
+_pending_uploads: Set[concurrent.futures.Future] = set()
+_pending_uploads_lock = threading.Lock()
+
+
+def _upload_done(future):
+    """
+    Forgets a finished upload processing job and logs its failure, if any.
+    """
+    with _pending_uploads_lock:
+        _pending_uploads.discard(future)
+    if future.exception() is not None:
+        logging.error(f"Processing an upload failed: {future.exception()}")
+
+
+def wait_for_pending_uploads(timeout=None):
+    """
+    Waits until all queued upload processing has finished.
+
+    Args:
+        timeout: The maximum number of seconds to wait, or None to wait
+            indefinitely.
+    """
+    with _pending_uploads_lock:
+        pending = list(_pending_uploads)
+    concurrent.futures.wait(pending, timeout=timeout)
+
+
+def _finish_upload(media_data, abs_file_path, db_path, thumbnail_dir_abs):
+    """
+    Completes an upload on the upload pool.
+
+    Images get their metadata and thumbnail first. Then the file is flushed
+    to disk and dropped from the page cache: originals are rarely read back
+    soon after upload, and keeping them cached would evict thumbnails that
+    are.
+
+    Args:
+        media_data: The entry stored for the upload.
+        abs_file_path: The absolute path of the uploaded file.
+        db_path: The path to the database file.
+        thumbnail_dir_abs: The absolute path to the thumbnail directory, or
+            None if the upload is not an image.
+    """
+    try:
+        if thumbnail_dir_abs is not None:
+            _process_uploaded_image(
+                media_data, abs_file_path, db_path, thumbnail_dir_abs
+            )
+    finally:
+        media_scanner.drop_page_cache(abs_file_path)
+
+
+def _process_uploaded_image(media_data, abs_file_path, db_path, thumbnail_dir_abs):
+    """
+    Fills in an uploaded image's metadata and thumbnail and updates its entry.
+
+    The image is opened once for its size, EXIF and thumbnail, as the scanner
+    does.
+
+    Args:
+        media_data: The entry stored for the upload, updated in place.
+        abs_file_path: The absolute path of the uploaded file.
+        db_path: The path to the database file.
+        thumbnail_dir_abs: The absolute path to the thumbnail directory.
+    """
+    sha256_hash = media_data["sha256_hex"]
+    try:
+        with PILImage.open(abs_file_path) as img:
+            media_data["width"], media_data["height"] = img.size
+            exif_date_str, latitude, longitude = media_scanner._read_exif_fields(img)
+            media_data["thumbnail_file"] = media_scanner.generate_thumbnail_from_image(
+                img, thumbnail_dir_abs, sha256_hash
+            )
+    except Exception as e:
+        logging.warning(f"Could not read uploaded image {abs_file_path}: {e}")
+        return
+
+    if exif_date_str:
+        try:
+            dt_obj = media_scanner.parse_exif_datetime(exif_date_str)
+            media_data["original_creation_date"] = dt_obj.timestamp()
+        except (ValueError, TypeError):
+            logging.warning(
+                f"Malformed EXIF date string '{exif_date_str}' in uploaded file."
+            )
+    media_data["latitude"] = latitude
+    media_data["longitude"] = longitude
+
+    db_utils.add_or_update_media_file(db_path, media_data)
+    db_utils.release_db_connection()
+    logging.info(f"Processed uploaded image {sha256_hash}")
+
+
+def _stream_size(stream):
+    """
+    Returns the size of a seekable stream and rewinds it, or None if unknown.
+    """
+    try:
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def _duplicate_upload_response(s_filename, sha256_hash, existing_entry):
+    """
+    Builds the response for an upload whose content is already in the DB.
+    """
+    logging.info(
+        f"Image with SHA256 {sha256_hash} (filename: {s_filename}) already exists in DB. Path: {existing_entry.get('file_path')}"
+    )
+    return (
+        jsonify(
+            {
+                "message": "Image content already exists in DB.",
+                "sha256": sha256_hash,
+                "filename": existing_entry.get("filename"),
+                "file_path": existing_entry.get("file_path"),
+            }
+        ),
+        200,
+    )  # OK, content already present
+
+
 @app.route("/image/<path:filename>", methods=["PUT"])
 def put_image(filename):  # filename comes from the <path:filename> URL part
     """
     Handles image uploads via PUT request.
 
-    This endpoint allows clients to upload new image files. The server saves
-    the file, generates a thumbnail, and adds a corresponding entry to the
-    database.
+    This endpoint allows clients to upload new image files, either as the
+    `file` part of a multipart form or as the raw request body. The server
+    saves the file and adds a corresponding entry to the database. Metadata
+    and the thumbnail are filled in afterwards by the upload pool. Uploads
+    larger than `MAX_CONTENT_LENGTH` are rejected with 413 before any of the
+    body is read.
 
     Args:
         filename: The filename for the uploaded image, extracted from the URL.
@@ -313,14 +887,22 @@ def put_image(filename):  # filename comes from the <path:filename> URL part
     Returns:
         A JSON response with details of the uploaded image or an error message.
     """
-    if "file" not in request.files:
-        abort(400, description="No file part in the request.")
-
-    file_from_request = request.files["file"]
-    original_client_filename = file_from_request.filename  # Original name from client
-
-    if original_client_filename == "":
-        abort(400, description="No selected file.")
+    if request.mimetype.startswith("multipart/"):
+        if "file" not in request.files:
+            abort(400, description="No file part in the request.")
+
+        file_from_request = request.files["file"]
+        # Original name from client
+        original_client_filename = file_from_request.filename
+        upload_stream = file_from_request.stream
+
+        if original_client_filename == "":
+            abort(400, description="No selected file.")
+    else:
+        # A raw request body is streamed straight to its destination, without
+        # Werkzeug spooling a multipart form to a temporary file first.
+        original_client_filename = os.path.basename(filename)
+        upload_stream = request.stream
 
     if not allowed_file(original_client_filename):
         abort(
@@ -337,33 +919,49 @@ def put_image(filename):  # filename comes from the <path:filename> URL part
                 "unnamed_upload" + os.path.splitext(original_client_filename)[1].lower()
             )
 
-    file_contents = file_from_request.read()
-    sha256_hash = hashlib.sha256(file_contents).hexdigest()
     db_path = app.config["DATABASE_PATH"]
-
-    existing_entry = db_utils.get_media_file_by_sha(db_path, sha256_hash)
-    if existing_entry:
-        logging.info(
-            f"Image with SHA256 {sha256_hash} (filename: {s_filename}) already exists in DB. Path: {existing_entry.get('file_path')}"
+    mime_type = media_scanner.guess_mime_type(s_filename)
+
+    # Re-synced photos are the common duplicate. If a known file has the same
+    # size, hash a spooled (seekable) upload in place first, so a duplicate is
+    # answered without writing it to disk. Only a full hash match counts.
+    upload_size = _stream_size(upload_stream)
+    if upload_size is not None and db_utils.media_file_size_exists(
+        db_path, upload_size
+    ):
+        sha256_hash, _ = media_scanner.get_stream_hash(
+            upload_stream, mime_type, upload_size
         )
-        return (
-            jsonify(
-                {
-                    "message": "Image content already exists in DB.",
-                    "sha256": sha256_hash,
-                    "filename": existing_entry.get("filename"),
-                    "file_path": existing_entry.get("file_path"),
-                }
-            ),
-            200,
-        )  # OK, content already present
+        upload_stream.seek(0)
+        existing_entry = db_utils.get_media_file_by_sha(db_path, sha256_hash)
+        if existing_entry:
+            return _duplicate_upload_response(s_filename, sha256_hash, existing_entry)
 
-    # Determine save path
     today_str = datetime.datetime.now().strftime("%Y%m%d")
     upload_subdir_rel = os.path.join("uploads", today_str)  # Relative to storage_dir
     upload_dir_abs = os.path.join(app.config["STORAGE_DIR"], upload_subdir_rel)
     os.makedirs(upload_dir_abs, exist_ok=True)
 
+    # Stream the upload to a temporary file in the destination directory,
+    # hashing it on the way, instead of holding it all in memory. The
+    # ".partial" suffix keeps the scanner from picking it up meanwhile.
+    partial_fd, partial_path = tempfile.mkstemp(suffix=".partial", dir=upload_dir_abs)
+    os.close(partial_fd)
+    try:
+        sha256_hash, hash_mode = media_scanner.save_stream_with_hash(
+            upload_stream, partial_path, mime_type
+        )
+    except IOError as e:
+        logging.error(f"Failed to save upload {s_filename} to {upload_dir_abs}: {e}")
+        os.remove(partial_path)
+        abort(500, description="Failed to save image to disk.")
+
+    existing_entry = db_utils.get_media_file_by_sha(db_path, sha256_hash)
+    if existing_entry:
+        os.remove(partial_path)
+        return _duplicate_upload_response(s_filename, sha256_hash, existing_entry)
+
+    # Determine save path
     base, ext = os.path.splitext(s_filename)
     ext = ext.lower()
     if not base and ext:
@@ -372,16 +970,28 @@ def put_image(filename):  # filename comes from the <path:filename> URL part
     final_filename_on_disk = f"{base}{ext}"
     prospective_path_on_disk_abs = os.path.join(upload_dir_abs, final_filename_on_disk)
     counter = 0
-    while os.path.exists(prospective_path_on_disk_abs):
-        counter += 1
-        final_filename_on_disk = f"{base}_{counter}{ext}"
-        prospective_path_on_disk_abs = os.path.join(
-            upload_dir_abs, final_filename_on_disk
-        )
-
     try:
-        with open(prospective_path_on_disk_abs, "wb") as f_save:
-            f_save.write(file_contents)
+        # Claim the name with an exclusive create, so concurrent uploads of
+        # the same name cannot pick (and overwrite) the same file, then move
+        # the upload over the placeholder.
+        while True:
+            try:
+                os.close(
+                    os.open(
+                        prospective_path_on_disk_abs,
+                        os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                        0o644,
+                    )
+                )
+                break
+            except FileExistsError:
+                counter += 1
+                final_filename_on_disk = f"{base}_{counter}{ext}"
+                prospective_path_on_disk_abs = os.path.join(
+                    upload_dir_abs, final_filename_on_disk
+                )
+        os.chmod(partial_path, 0o644)  # mkstemp creates it owner-only.
+        os.replace(partial_path, prospective_path_on_disk_abs)
         logging.info(
             f"Saved new image: {final_filename_on_disk} to {upload_subdir_rel} (SHA256: {sha256_hash})"
         )
@@ -389,92 +999,57 @@ def put_image(filename):  # filename comes from the <path:filename> URL part
         logging.error(
             f"Failed to save file {final_filename_on_disk} to {upload_dir_abs}: {e}"
         )
+        os.remove(partial_path)
         abort(500, description="Failed to save image to disk.")
 
-    # Process the newly saved file to add it to the database
-    # This reuses parts of the scanner logic for a single file.
-    # _process_single_file needs abs_storage_dir, abs_file_path, sha, db_path, thumbnail_dir_abs, disk_filename
-    # We can call a simplified version or directly populate media_data
-
-    thumbnail_dir_abs = app.config["THUMBNAIL_DIR"]
-    thumbnail_relative_path = None
-    mime_type_upload, _ = mimetypes.guess_type(prospective_path_on_disk_abs)
-    filesize = os.path.getsize(prospective_path_on_disk_abs)
-
-    if mime_type_upload and mime_type_upload.startswith("image/"):
-        thumbnail_relative_path = media_scanner.generate_thumbnail(
-            prospective_path_on_disk_abs, thumbnail_dir_abs, sha256_hash
-        )
-
-    # Extract metadata (simplified from _process_single_file)
-    last_modified = os.path.getmtime(prospective_path_on_disk_abs)
-    original_creation_date = os.path.getctime(prospective_path_on_disk_abs)  # Default
-    image_width, image_height = None, None
-    latitude, longitude = None, None
-
-    if mime_type_upload and mime_type_upload.startswith("image/"):
-        try:
-            from PIL import (
-                Image as PILImage,
-                ExifTags as PILExifTags,
-            )  # Local import for safety
-
-            with PILImage.open(prospective_path_on_disk_abs) as img:
-                image_width, image_height = img.size
-                exif_data = img.getexif()
-                if exif_data:
-                    # Prefer DateTimeOriginal (36867), fallback to DateTime (306)
-                    date_time_original_tag = 36867
-                    date_time_tag = 306
-
-                    exif_date_str = None
-                    if date_time_original_tag in exif_data:
-                        exif_date_str = exif_data[date_time_original_tag]
-                    elif date_time_tag in exif_data:
-                        exif_date_str = exif_data[date_time_tag]
-
-                    if exif_date_str:
-                        try:
-                            dt_obj = datetime.datetime.strptime(
-                                exif_date_str, "%Y:%m:%d %H:%M:%S"
-                            )
-                            original_creation_date = dt_obj.timestamp()
-                        except (ValueError, TypeError):
-                            logging.warning(
-                                f"Malformed EXIF date string '{exif_date_str}' in uploaded file."
-                            )
-
-                    lat, lon = media_scanner._get_gps_coordinates_from_exif(exif_data)
-                    if lat is not None:
-                        latitude = lat
-                    if lon is not None:
-                        longitude = lon
-        except Exception as e:
-            logging.warning(
-                f"Could not read full EXIF for uploaded {final_filename_on_disk}: {e}"
-            )
-
+    # Store a basic entry right away so the image is served (and duplicate
+    # uploads are recognized) immediately. Reading its metadata and
+    # generating its thumbnail happen on the upload pool, off the request.
     relative_file_path_for_db = os.path.join(upload_subdir_rel, final_filename_on_disk)
+    file_stat = os.stat(prospective_path_on_disk_abs)
     media_data = {
         "sha256_hex": sha256_hash,
         "filename": final_filename_on_disk,  # Name on disk in its upload subfolder
         "original_filename": original_client_filename,  # Original name from client
         "file_path": relative_file_path_for_db,  # Relative to storage_dir
-        "last_modified": last_modified,
-        "original_creation_date": original_creation_date,
-        "thumbnail_file": thumbnail_relative_path,
-        "width": image_width,
-        "height": image_height,
-        "latitude": latitude,
-        "longitude": longitude,
-        "mime_type": mime_type_upload,
-        "filesize": filesize,
+        "last_modified": file_stat.st_mtime,
+        "original_creation_date": file_stat.st_ctime,  # Default
+        "thumbnail_file": None,
+        "width": None,
+        "height": None,
+        "latitude": None,
+        "longitude": None,
+        "mime_type": media_scanner.guess_mime_type(prospective_path_on_disk_abs),
+        "filesize": file_stat.st_size,
+        "hash_algo": media_scanner.HASH_ALGO,
+        "hash_mode": hash_mode,
     }
     db_utils.add_or_update_media_file(db_path, media_data)
     logging.info(
         f"DB entry created for uploaded SHA256: {sha256_hash}, file {final_filename_on_disk}"
     )
 
+    thumbnail_pending = bool(
+        media_data["mime_type"] and media_data["mime_type"].startswith("image/")
+    )
+    if thumbnail_pending:
+        try:
+            # Only parses the header; the pixels are decoded on the pool.
+            with PILImage.open(prospective_path_on_disk_abs) as img:
+                media_data["width"], media_data["height"] = img.size
+        except Exception as e:
+            logging.warning(f"Could not read size of uploaded {s_filename}: {e}")
+    future = _upload_executor.submit(
+        _finish_upload,
+        media_data,
+        prospective_path_on_disk_abs,
+        db_path,
+        app.config["THUMBNAIL_DIR"] if thumbnail_pending else None,
+    )
+    with _pending_uploads_lock:
+        _pending_uploads.add(future)
+    future.add_done_callback(_upload_done)
+
     return (
         jsonify(
             {
@@ -482,9 +1057,10 @@ def put_image(filename):  # filename comes from the <path:filename> URL part
                 "sha256": sha256_hash,
                 "filename": final_filename_on_disk,
                 "file_path": relative_file_path_for_db,
-                "thumbnail_file": thumbnail_relative_path,
-                "width": image_width,
-                "height": image_height,
+                "thumbnail_file": None,
+                "thumbnail_pending": thumbnail_pending,
+                "width": media_data["width"],
+                "height": media_data["height"],
             }
         ),
         201,
@@ -503,9 +1079,7 @@ def get_image(sha256_hex):
     Returns:
         The image file as a response, or a 404 error if not found.
     """
-    if not (
-        len(sha256_hex) == 64 and all(c in "0123456789abcdefABCDEF" for c in sha256_hex)
-    ):
+    if not SHA256_HEX_RE.fullmatch(sha256_hex):
         abort(400, description="Invalid SHA256 format.")
 
     db_entry = db_utils.get_media_file_by_sha(app.config["DATABASE_PATH"], sha256_hex)
@@ -519,20 +1093,124 @@ def get_image(sha256_hex):
             description="Server error: Image metadata incomplete in DB (no file_path).",
         )
 
-    storage_dir_abs = app.config["STORAGE_DIR"]
-    # Security check (already in db_utils.get_media_file_by_sha, but defense in depth)
-    full_file_path = os.path.normpath(os.path.join(storage_dir_abs, file_path_relative))
-    if not full_file_path.startswith(
-        os.path.normpath(storage_dir_abs) + os.sep
-    ) and not full_file_path == os.path.normpath(storage_dir_abs):
-        abort(400, description="Invalid file path generated.")
-
     try:
-        return send_from_directory(storage_dir_abs, file_path_relative)
+        return _send_media_file(
+            app.config["STORAGE_DIR"],
+            file_path_relative,
+            db_entry.get("mime_type"),
+            sha256_hex,
+        )
     except NotFound:
         abort(404, description="Image file not found on disk (DB out of sync?).")
 
 
+def _send_media_file(directory, relative_path, mimetype, etag):
+    """
+    Sends a file from under the storage directory.
+
+    The path is validated once with `safe_join`. If `X_ACCEL_REDIRECT_PREFIX`
+    is configured, only the headers are sent and nginx serves the file itself
+    from its internal location. Otherwise the file goes through `send_file`,
+    which uses X-Sendfile when `USE_X_SENDFILE` is set. Either way a request
+    whose If-None-Match matches `etag` gets a 304.
+
+    Args:
+        directory: The absolute directory the file lives in.
+        relative_path: The file path relative to `directory`.
+        mimetype: The MIME type of the file, or None to guess it.
+        etag: The strong ETag of the file, e.g. its content hash.
+
+    Returns:
+        A Flask response.
+
+    Raises:
+        BadRequest: If `relative_path` escapes `directory`.
+        NotFound: If the file does not exist.
+    """
+    full_path = safe_join(directory, relative_path)
+    if full_path is None:
+        abort(400, description="Invalid file path.")
+
+    prefix = app.config.get("X_ACCEL_REDIRECT_PREFIX")
+    if not prefix:
+        try:
+            # send_file stats and opens the file itself, so a missing file
+            # surfaces here instead of costing a separate existence check.
+            response = send_file(
+                full_path,
+                mimetype=mimetype,
+                max_age=MEDIA_CACHE_MAX_AGE,
+                etag=etag,
+            )
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise NotFound()
+        response.cache_control.immutable = True
+        return response
+
+    if not os.path.isfile(full_path):
+        raise NotFound()
+    storage_path = os.path.relpath(full_path, app.config["STORAGE_DIR"])
+    response = Response(
+        mimetype=mimetype or media_scanner.guess_mime_type(relative_path)
+    )
+    response.headers["X-Accel-Redirect"] = (
+        f"{prefix.rstrip('/')}/{quote(storage_path.replace(os.sep, '/'))}"
+    )
+    response.cache_control.public = True
+    response.cache_control.max_age = MEDIA_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def _read_thumbnail(thumbnail_path, sha256_hex):
+    """
+    Returns a thumbnail's bytes, from memory if it was served recently.
+
+    Thumbnails are small and requested over and over while clients scroll,
+    so the most recently used ones are kept in memory, evicting the least
+    recently used beyond `THUMBNAIL_CACHE_BYTES`.
+
+    Args:
+        thumbnail_path: The absolute path of the thumbnail file.
+        sha256_hex: The hash of the original, used as the cache key.
+
+    Returns:
+        The PNG data, or None if the thumbnail file does not exist.
+    """
+    global _thumbnail_cache_bytes
+    with _thumbnail_cache_lock:
+        data = _thumbnail_cache.get(sha256_hex)
+        if data is not None:
+            _thumbnail_cache.move_to_end(sha256_hex)
+            return data
+    try:
+        with open(thumbnail_path, "rb") as f:
+            data = f.read()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+    budget = app.config.get("THUMBNAIL_CACHE_BYTES", 0)
+    with _thumbnail_cache_lock:
+        if len(data) <= budget and sha256_hex not in _thumbnail_cache:
+            _thumbnail_cache[sha256_hex] = data
+            _thumbnail_cache_bytes += len(data)
+            while _thumbnail_cache_bytes > budget:
+                _, evicted = _thumbnail_cache.popitem(last=False)
+                _thumbnail_cache_bytes -= len(evicted)
+    return data
+
+
+def clear_thumbnail_cache():
+    """
+    Drops all thumbnails kept in memory, e.g. after a scan removed some.
+    """
+    global _thumbnail_cache_bytes
+    with _thumbnail_cache_lock:
+        _thumbnail_cache.clear()
+        _thumbnail_cache_bytes = 0
+
+
 settings_manager: settings_utils.SettingsManager = None
 
 
@@ -557,9 +1235,10 @@ def put_settings():
         new_settings = settings_utils.Settings(**request.json)
         settings_manager.write_settings(new_settings)
 
-        if current_settings.rescan_interval <= 0 and new_settings.rescan_interval > 0:
+        if current_settings.rescan_interval != new_settings.rescan_interval:
             logging.info(
-                "Rescan interval changed from disabled to enabled, waking up scanner."
+                f"Rescan interval changed from {current_settings.rescan_interval}s "
+                f"to {new_settings.rescan_interval}s, waking up scanner."
             )
             scanner_wakeup_event.set()
 
@@ -573,17 +1252,43 @@ def get_thumbnail(sha256_hex):
     """
     Serves a thumbnail image for a given SHA256 hash.
 
+    Thumbnails are stored sharded by hash prefix ('ab/abcdef....png'), so the
+    path is computed from the hash rather than looked up.
+
     Args:
         sha256_hex: The SHA256 hash of the original image.
 
     Returns:
         The thumbnail image file as a response, or a 404 error if not found.
     """
-    if not (
-        len(sha256_hex) == 64 and all(c in "0123456789abcdefABCDEF" for c in sha256_hex)
-    ):
+    if not SHA256_HEX_RE.fullmatch(sha256_hex):
         abort(400, description="Invalid SHA256 format.")
 
+    # Thumbnail paths are derived from the hash, so in the common case the
+    # file is served without a database lookup. The database is only
+    # consulted to explain why a thumbnail is missing.
+    thumbnail_dir_abs = app.config["THUMBNAIL_DIR"]
+    thumbnail_path, thumbnail_relative_path = media_scanner._thumbnail_paths(
+        thumbnail_dir_abs, sha256_hex
+    )
+    if app.config.get("THUMBNAIL_CACHE_BYTES") and not (
+        app.config.get("X_ACCEL_REDIRECT_PREFIX") or app.config.get("USE_X_SENDFILE")
+    ):
+        data = _read_thumbnail(thumbnail_path, sha256_hex)
+        if data is not None:
+            response = Response(data, mimetype="image/png")
+            response.cache_control.public = True
+            response.cache_control.max_age = MEDIA_CACHE_MAX_AGE
+            response.cache_control.immutable = True
+            response.set_etag(sha256_hex)
+            return response.make_conditional(request)
+    try:
+        return _send_media_file(
+            thumbnail_dir_abs, thumbnail_relative_path, "image/png", sha256_hex
+        )
+    except NotFound:
+        pass
+
     db_entry = db_utils.get_media_file_by_sha(app.config["DATABASE_PATH"], sha256_hex)
     if not db_entry:
         abort(404, description="Image SHA not found in DB, so no thumbnail.")
@@ -601,23 +1306,9 @@ def get_thumbnail(sha256_hex):
             )
         abort(404, description="Thumbnail not available for this item.")
 
-    thumbnail_dir_abs = app.config["THUMBNAIL_DIR"]
-    if not os.path.isdir(thumbnail_dir_abs):  # Should have been created by scanner
-        abort(
-            500, description="Thumbnail directory misconfigured or missing on server."
-        )
-
-    # Security check for thumbnail_relative_path (e.g. 'ab/hash.png')
-    # Ensure it doesn't try to escape thumbnail_dir_abs
-    full_thumb_path = os.path.normpath(
-        os.path.join(thumbnail_dir_abs, thumbnail_relative_path)
-    )
-    if not full_thumb_path.startswith(os.path.normpath(thumbnail_dir_abs) + os.sep):
-        abort(400, description="Invalid thumbnail path.")
-
     try:
-        return send_from_directory(
-            thumbnail_dir_abs, thumbnail_relative_path, mimetype="image/png"
+        return _send_media_file(
+            thumbnail_dir_abs, thumbnail_relative_path, "image/png", sha256_hex
         )
     except NotFound:
         # This implies DB has a thumbnail_file entry, but the file is missing.
@@ -628,12 +1319,36 @@ def get_thumbnail(sha256_hex):
         abort(404, description="Thumbnail file missing on disk.")
 
 
+def _log_through_queue():
+    """
+    Moves log output off the threads that produce it.
+
+    absl's handler is detached from the root logger and fed by a
+    `QueueListener` thread, so request and worker threads only enqueue
+    records instead of formatting and writing them under the handler's lock.
+
+    Returns:
+        The started listener, or None if absl's handler is not installed.
+    """
+    absl_handler = logging.get_absl_handler()
+    root_logger = python_logging.getLogger()
+    if absl_handler not in root_logger.handlers:
+        return None
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, absl_handler, respect_handler_level=True)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.removeHandler(absl_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
 def run_flask_app(argv):
     """
     Configures and starts the Flask web server.
 
     This function initializes the application, sets up the database, performs
-    an initial media scan, and starts the Flask development server.
+    an initial media scan, and starts the HTTP server.
 
     Args:
         argv: Command-line arguments passed to the application.
@@ -641,6 +1356,7 @@ def run_flask_app(argv):
     del argv  # Unused.
 
     logging.set_verbosity(logging.INFO)
+    _log_through_queue()
 
     storage_dir = FLAGS.storage_dir
     if not storage_dir:
@@ -651,7 +1367,22 @@ def run_flask_app(argv):
     storage_dir = os.path.abspath(storage_dir)
     os.makedirs(storage_dir, exist_ok=True)  # Ensure storage_dir exists
 
+    media_scanner.HASH_ALGO = FLAGS.hash_algo
+    media_scanner.SPARSE_VIDEO_HASH = FLAGS.sparse_video_hash
+    try:
+        media_scanner.new_content_hasher()
+    except RuntimeError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
     app.config["STORAGE_DIR"] = storage_dir
+    app.config["PRUNE_UNCHANGED_DIRS"] = FLAGS.prune_unchanged_dirs
+    app.config["X_ACCEL_REDIRECT_PREFIX"] = FLAGS.x_accel_redirect_prefix
+    app.config["USE_X_SENDFILE"] = FLAGS.use_x_sendfile
+    app.config["THUMBNAIL_CACHE_BYTES"] = FLAGS.thumbnail_cache_mb << 20
+    app.config["MAX_CONTENT_LENGTH"] = (
+        FLAGS.max_upload_mb << 20 if FLAGS.max_upload_mb > 0 else None
+    )
     app.config["THUMBNAIL_DIR"] = os.path.join(
         storage_dir, media_scanner.THUMBNAIL_DIR_NAME
     )
@@ -687,35 +1418,74 @@ def run_flask_app(argv):
     finally:
         db_utils.close_db_connection()  # Close connection for main thread after init
 
-    # Initial scan of the media directory (rescan=False)
-    logging.info(
-        f"Performing initial scan of storage directory: {app.config['STORAGE_DIR']}"
-    )
-    try:
-        media_scanner.scan_directory(
-            app.config["STORAGE_DIR"], app.config["DATABASE_PATH"], rescan=False
+    # With a library already in the database, serve it right away and let
+    # the scanner thread do the startup scan; only a new library is scanned
+    # before the server starts.
+    db_path = app.config["DATABASE_PATH"]
+    scan_in_background = db_utils.count_media_files(db_path) > 0
+    db_utils.close_db_connection()
+    if scan_in_background:
+        logging.info(
+            "Serving the existing library; the startup scan runs in the background."
         )
-    except Exception as e:
-        logging.error(f"Error during initial scan: {e}", exc_info=True)
-        # Decide if server should start if initial scan fails. For now, it will.
-    finally:
-        db_utils.close_db_connection()  # Close connection for main thread after scan
-
-    num_items_in_db = len(db_utils.get_all_media_files(app.config["DATABASE_PATH"]))
-    logging.info(f"Initial scan complete. Database contains {num_items_in_db} items.")
-    db_utils.close_db_connection()  # Close again, just in case get_all_media_files opened one.
+        warm_list_cache(db_path)
+        db_utils.close_db_connection()
+    else:
+        initial_scan(app.config["STORAGE_DIR"], db_path)
 
     # The background scanner will start and then manage its own loop and sleep interval
     # based on the settings. It no longer depends on a startup flag to be enabled.
     scanner_thread = threading.Thread(
         target=background_scanner_task,
-        args=(app.app_context(), settings_manager),
+        args=(app.app_context(), settings_manager, scan_in_background),
         daemon=True,
     )
     scanner_thread.start()
+    # atexit runs handlers last-in first-out: stop the scanner, then give a
+    # scan in progress a moment to finish.
+    atexit.register(scanner_thread.join, timeout=10)
+    atexit.register(stop_background_scanner)
+
+    if FLAGS.watch_storage_dir:
+        if watcher.is_available():
+            watcher.StorageWatcher(storage_dir, request_rescan).start()
+        else:
+            logging.warning(
+                "--watch_storage_dir needs the inotify_simple package; "
+                "relying on periodic rescans."
+            )
+
+    serve(FLAGS.http_server, FLAGS.port, FLAGS.server_threads)
+
+
+def serve(http_server, port, threads):
+    """
+    Serves the app until the process is stopped.
 
-    logging.info(f"Starting Flask HTTP server on port {FLAGS.port}...")
-    app.run(host="0.0.0.0", port=FLAGS.port, debug=False, use_reloader=False)
+    waitress multiplexes all connections on a single event loop and only
+    hands complete requests to its worker threads, so slow or idle clients
+    do not tie up a thread each the way they do with Flask's built-in,
+    thread-per-connection server.
+
+    Args:
+        http_server: "waitress", "flask", or "auto" to use waitress when it
+            is installed.
+        port: The port to listen on.
+        threads: The number of waitress worker threads.
+    """
+    if http_server == "auto":
+        http_server = "waitress" if waitress is not None else "flask"
+    if http_server == "waitress":
+        if waitress is None:
+            logging.error("--http_server=waitress needs the waitress package.")
+            sys.exit(1)
+        logging.info(
+            f"Starting waitress HTTP server on port {port} with {threads} threads..."
+        )
+        waitress.serve(app, host="0.0.0.0", port=port, threads=threads)
+        return
+    logging.info(f"Starting Flask HTTP server on port {port}...")
+    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
 
 
 def main_flask():
@@ -0,0 +1,169 @@
+import os
+import threading
+from typing import Callable, Dict, Optional, Set
+
+from absl import logging
+
+try:
+    import inotify_simple  # Optional, Linux only
+except ImportError:
+    inotify_simple = None
+
+try:
+    from . import media_scanner
+except ImportError:
+    from media_server import media_scanner
+
+
+def is_available() -> bool:
+    """Returns True if filesystem change notifications are supported here."""
+    return inotify_simple is not None
+
+
+class StorageWatcher:
+    """
+    Watches a storage directory tree and reports when media in it changes.
+
+    Only directories are watched, one inotify watch each, so the number of
+    watches grows with the number of directories rather than files. Events
+    are coalesced: `on_change` is called once the tree has been quiet for
+    `debounce_seconds`, so copying in a whole folder triggers one rescan.
+    It is passed the set of directories whose contents changed, so only those
+    need to be listed again, or None if events were lost and the whole tree
+    must be rescanned.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        on_change: Callable[[Optional[Set[str]]], None],
+        debounce_seconds: float = 2.0,
+    ):
+        """
+        Initializes the watcher.
+
+        Args:
+            root: The absolute path of the directory tree to watch.
+            on_change: Called from the watcher thread after changes, with the
+                absolute paths of the changed directories, or None if the
+                kernel's event queue overflowed.
+            debounce_seconds: How long the tree must be quiet before
+                `on_change` is called.
+
+        Raises:
+            RuntimeError: If the inotify_simple package is not installed.
+        """
+        if inotify_simple is None:
+            raise RuntimeError(
+                "Watching the storage directory needs the inotify_simple package."
+            )
+        self.root = root
+        self.on_change = on_change
+        self.debounce_seconds = debounce_seconds
+        self._inotify = inotify_simple.INotify()
+        self._watch_paths: Dict[int, str] = {}
+        self._overflowed = False
+        flags = inotify_simple.flags
+        self._file_mask = (
+            flags.CREATE
+            | flags.CLOSE_WRITE
+            | flags.MOVED_TO
+            | flags.MOVED_FROM
+            | flags.DELETE
+        )
+        self._watch_mask = self._file_mask | flags.DELETE_SELF | flags.ONLYDIR
+
+    def start(self) -> threading.Thread:
+        """
+        Adds watches for the whole tree and starts the watcher thread.
+
+        Returns:
+            The started daemon thread.
+        """
+        self._add_tree(self.root)
+        logging.info(f"Watching {len(self._watch_paths)} directories under {self.root}")
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return thread
+
+    def _add_tree(self, path: str) -> None:
+        """Watches `path` and every directory below it, skipping hidden ones."""
+        try:
+            wd = self._inotify.add_watch(path, self._watch_mask)
+        except OSError as e:
+            logging.warning(f"Could not watch directory {path}: {e}")
+            return
+        self._watch_paths[wd] = path
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [
+                    entry.path
+                    for entry in entries
+                    if not entry.name.startswith(".")
+                    and entry.is_dir(follow_symlinks=False)
+                ]
+        except OSError as e:
+            logging.warning(f"Could not list directory {path}: {e}")
+            return
+        for subdir in subdirs:
+            self._add_tree(subdir)
+
+    def _handle_events(self, events, changed_dirs: Set[str]) -> bool:
+        """
+        Updates the watches for a batch of events.
+
+        Args:
+            events: inotify events, as returned by `INotify.read()`.
+            changed_dirs: The directories changed so far, to which the
+                parents of relevant events are added.
+
+        Returns:
+            True if any event concerns media or the directory structure.
+        """
+        flags = inotify_simple.flags
+        changed = False
+        for event in events:
+            if event.mask & flags.Q_OVERFLOW:
+                self._overflowed = True
+                changed = True
+                continue
+            if event.mask & flags.IGNORED:
+                self._watch_paths.pop(event.wd, None)
+                continue
+            parent = self._watch_paths.get(event.wd)
+            if parent is None or not event.name or event.name.startswith("."):
+                continue
+            if event.mask & flags.ISDIR:
+                changed = True
+                changed_dirs.add(parent)
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    subdir = os.path.join(parent, event.name)
+                    self._add_tree(subdir)
+                    # Its contents predate the watch, so list it too.
+                    changed_dirs.add(subdir)
+            elif event.mask & self._file_mask and media_scanner.is_media_file(
+                event.name
+            ):
+                changed = True
+                changed_dirs.add(parent)
+        return changed
+
+    def _run(self) -> None:
+        """Reads events forever, calling `on_change` once changes settle."""
+        pending = False
+        changed_dirs: Set[str] = set()
+        while True:
+            timeout_ms = int(self.debounce_seconds * 1000) if pending else None
+            events = self._inotify.read(timeout=timeout_ms)
+            if events:
+                pending = self._handle_events(events, changed_dirs) or pending
+                continue
+            if pending:
+                result = None if self._overflowed else changed_dirs
+                pending = False
+                changed_dirs = set()
+                self._overflowed = False
+                try:
+                    self.on_change(result)
+                except Exception as e:
+                    logging.error(f"Storage change handler failed: {e}", exc_info=True)
@@ -16,6 +16,7 @@ setup(
         'Werkzeug',
         'pillow-heif',
         'piexif',
+        'numpy',
         'keras',
         'torch',
         'torchvision',
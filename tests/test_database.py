@@ -1,7 +1,9 @@
 import unittest
 import os
+import sqlite3
 import tempfile
 import shutil
+import threading
 import time
 import sys
 
@@ -100,6 +102,9 @@ class TestDataFiltering(unittest.TestCase):
         results = db_utils.get_media_files_by_location(self.db_path, 'Paris')
         self.assertEqual(len(results), 0)
 
+    def test_count_media_files(self):
+        self.assertEqual(db_utils.count_media_files(self.db_path), 4)
+
     def test_get_media_files_by_location_case_insensitive(self):
         # Test for a city with different case
         results = db_utils.get_media_files_by_location(self.db_path, 'new york')
@@ -111,5 +116,101 @@ class TestDataFiltering(unittest.TestCase):
         results = db_utils.get_media_files_by_location(self.db_path, 'new york', 'usa')
         self.assertEqual(len(results), 2)
 
+class TestInitDbMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="db_migration_test_")
+        self.db_path = db_utils.get_db_path(self.test_dir)
+
+    def tearDown(self):
+        db_utils.close_db_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_init_db_adds_missing_columns(self):
+        # A database created before hash_algo existed
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE media_files (sha256_hex TEXT PRIMARY KEY, filename TEXT NOT NULL, "
+            "original_filename TEXT, file_path TEXT NOT NULL UNIQUE, last_modified REAL NOT NULL, "
+            "original_creation_date REAL, thumbnail_file TEXT, width INTEGER, height INTEGER, "
+            "latitude REAL, longitude REAL, city TEXT, country TEXT, mime_type TEXT, "
+            "filesize INTEGER, tags TEXT, tagging_model TEXT)"
+        )
+        conn.commit()
+        conn.close()
+
+        db_utils.init_db(self.test_dir)
+        db_utils.add_or_update_media_file(self.db_path, {
+            'sha256_hex': 'hash1', 'filename': 'file1.jpg', 'file_path': 'path1',
+            'last_modified': time.time(), 'hash_algo': 'sha256'
+        })
+        entry = db_utils.get_media_file_by_sha(self.db_path, 'hash1')
+        self.assertEqual(entry['hash_algo'], 'sha256')
+
+class TestBatchWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="db_batch_test_")
+        self.db_path = db_utils.get_db_path(self.test_dir)
+        db_utils.init_db(self.test_dir)
+
+    def tearDown(self):
+        db_utils.close_db_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_add_or_update_media_files(self):
+        db_utils.add_or_update_media_file(self.db_path, {
+            'sha256_hex': 'old', 'filename': 'a.jpg', 'file_path': 'a.jpg', 'last_modified': 1.0
+        })
+        db_utils.add_or_update_media_files(self.db_path, [
+            {'sha256_hex': 'new', 'filename': 'a.jpg', 'file_path': 'a.jpg', 'last_modified': 2.0},
+            {'sha256_hex': 'other', 'filename': 'b.jpg', 'file_path': 'b.jpg', 'last_modified': 3.0},
+        ])
+        # The path's previous content is replaced, as with single writes.
+        self.assertEqual(set(db_utils.get_all_media_files(self.db_path)), {'new', 'other'})
+
+    def test_delete_media_files_by_sha(self):
+        db_utils.add_or_update_media_files(self.db_path, [
+            {'sha256_hex': s, 'filename': s, 'file_path': s, 'last_modified': 1.0}
+            for s in ('a', 'b', 'c')
+        ])
+        self.assertEqual(db_utils.delete_media_files_by_sha(self.db_path, ['a', 'c', 'missing']), 2)
+        self.assertEqual(set(db_utils.get_all_media_files(self.db_path)), {'b'})
+
+    def test_add_or_update_media_files_is_atomic(self):
+        with self.assertRaises(ValueError):
+            db_utils.add_or_update_media_files(self.db_path, [
+                {'sha256_hex': 'ok', 'filename': 'a.jpg', 'file_path': 'a.jpg', 'last_modified': 1.0},
+                {'sha256_hex': 'bad', 'filename': 'b.jpg', 'file_path': None, 'last_modified': 1.0},
+            ])
+        self.assertEqual(db_utils.get_all_media_files(self.db_path), {})
+
 if __name__ == '__main__':
     unittest.main()
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="db_pool_test_")
+        self.db_path = db_utils.get_db_path(self.test_dir)
+        db_utils.init_db(self.test_dir)
+
+    def tearDown(self):
+        db_utils.close_db_connection()
+        db_utils.close_idle_connections()
+        shutil.rmtree(self.test_dir)
+
+    def test_released_connection_is_reused(self):
+        conn = db_utils.get_db_connection(self.db_path)
+        db_utils.release_db_connection()
+
+        reused = []
+        thread = threading.Thread(
+            target=lambda: reused.append(db_utils.get_db_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        self.assertIs(reused[0], conn)
+
+    def test_connection_uses_wal(self):
+        conn = db_utils.get_db_connection(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
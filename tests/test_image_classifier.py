@@ -74,5 +74,22 @@ class TestImageClassifier(unittest.TestCase):
             self.assertIsInstance(predictions[0][0], str)
             self.assertIsInstance(predictions[0][1], float)
 
+    @patch('media_server.image_classifier.image')
+    @patch('media_server.image_classifier.ResNet50V2')
+    def test_classify_images_batches(self, mock_resnet, mock_image):
+        mock_model_instance = mock_resnet.return_value
+        mock_model_instance.predict.side_effect = lambda x, batch_size: np.random.rand(len(x), 1000)
+        mock_image.load_img.side_effect = lambda path, target_size: MagicMock()
+        mock_image.img_to_array.return_value = np.random.rand(224, 224, 3)
+
+        with patch('media_server.image_classifier.resnet_decode') as mock_decode:
+            mock_decode.side_effect = lambda preds, top: [[('n0', 'tabby', 0.5)] for _ in preds]
+            classifier = ImageClassifier(self.settings)
+            predictions = classifier.classify_images(['a.jpg', 'b.jpg', 'c.jpg'], batch_size=2)
+
+        # Two forward passes (2 + 1 images), one result list per path.
+        self.assertEqual(mock_model_instance.predict.call_count, 2)
+        self.assertEqual(predictions, [[('tabby', 0.5)]] * 3)
+
 if __name__ == '__main__':
     unittest.main()
@@ -142,11 +142,43 @@ class TestMediaScannerWithDB(unittest.TestCase):
     def test_is_media_file(self):
         self.assertTrue(media_scanner.is_media_file("test.jpg"))
         self.assertFalse(media_scanner.is_media_file("test.txt"))
+        self.assertTrue(media_scanner.is_media_file("TEST.JPG"))
+        self.assertEqual(media_scanner.guess_mime_type("dir/clip.MP4"), "video/mp4")
+        self.assertIsNone(media_scanner.guess_mime_type("no_extension"))
+
+    def test_convert_dms_to_decimal(self):
+        self.assertAlmostEqual(media_scanner._convert_dms_to_decimal(self.gps_lat_dms, 'N'), self.expected_gps_lat_decimal)
+        self.assertAlmostEqual(media_scanner._convert_dms_to_decimal(self.gps_lon_dms, 'W'), self.expected_gps_lon_decimal)
+        self.assertAlmostEqual(media_scanner._convert_dms_to_decimal(((34, 1), (30, 1), (0, 1)), 'S'), -34.5)
+        self.assertIsNone(media_scanner._convert_dms_to_decimal(self.gps_lat_dms, 'X'))
+        self.assertIsNone(media_scanner._convert_dms_to_decimal((1, 2), 'N'))
+
+    def test_parse_exif_datetime(self):
+        self.assertEqual(media_scanner.parse_exif_datetime("2023:01:15 10:20:30"), dt(2023, 1, 15, 10, 20, 30))
+        # Not zero-padded: falls back to strptime, which accepts it.
+        self.assertEqual(media_scanner.parse_exif_datetime("2023:1:5 10:20:30"), dt(2023, 1, 5, 10, 20, 30))
+        for malformed in ("2023:13:15 10:20:30", "0000:00:00 00:00:00", "2023-01-15 10:20:30", ""):
+            with self.assertRaises(ValueError):
+                media_scanner.parse_exif_datetime(malformed)
 
     def test_get_file_sha256(self):
         self.assertEqual(media_scanner.get_file_sha256(self.file_img1), self.hash_img1)
         self.assertIsNone(media_scanner.get_file_sha256("non_existent_file.jpg"))
 
+    def test_get_file_hash_sparse_video(self):
+        chunk = media_scanner.SPARSE_HASH_CHUNK
+        content = b"h" * chunk + b"middle" * 10 + b"t" * chunk
+        video_path = create_dummy_file(self.test_dir, "large.mp4", content)
+        expected = hashlib.sha256(b"h" * chunk + b"t" * chunk + len(content).to_bytes(8, "little")).hexdigest()
+
+        with mock.patch.object(media_scanner, 'SPARSE_VIDEO_HASH', True), \
+                mock.patch.object(media_scanner, 'SPARSE_HASH_MIN_SIZE', chunk):
+            self.assertEqual(media_scanner.get_file_hash(video_path, fast=True), expected)
+            self.assertEqual(media_scanner.get_bytes_hash(content, 'video/mp4'), (expected, 'sparse'))
+            # Images and non-fast callers always get the full content hash
+            self.assertEqual(media_scanner.get_file_hash(video_path), calculate_sha256_str(content))
+            self.assertEqual(media_scanner.get_file_hash(self.file_img1, fast=True), self.hash_img1)
+
     def test_scan_directory_empty(self):
         empty_dir = os.path.join(self.test_dir, "empty_subdir_for_scan")
         os.makedirs(empty_dir)
@@ -182,7 +214,9 @@ class TestMediaScannerWithDB(unittest.TestCase):
         self.assertEqual(path_parts[0], expected_subdir_name)
         self.assertEqual(path_parts[1], expected_sha + media_scanner.THUMBNAIL_EXTENSION)
         with Image.open(full_thumb_path) as thumb_img:
-            self.assertEqual(thumb_img.size, media_scanner.THUMBNAIL_SIZE)
+            # Thumbnails keep the source's aspect ratio within THUMBNAIL_SIZE.
+            self.assertLessEqual(thumb_img.width, media_scanner.THUMBNAIL_SIZE[0])
+            self.assertLessEqual(thumb_img.height, media_scanner.THUMBNAIL_SIZE[1])
             self.assertEqual(thumb_img.format, 'PNG')
             # ... (rest of the detailed pixel checks from original test if needed)
 
@@ -220,11 +254,23 @@ class TestMediaScannerWithDB(unittest.TestCase):
         # Check image_with_exif.jpg
         data_img_exif = result_from_db.get(self.hash_img_exif)
         self.assertIsNotNone(data_img_exif)
+        self.assertAlmostEqual(data_img_exif['original_creation_date'], self.exif_timestamp)
 
         # Check image_with_gps.jpg
         data_img_gps = result_from_db.get(self.hash_img_gps)
         self.assertIsNotNone(data_img_gps)
 
+    def test_scan_thumbnails_from_metadata_pass(self):
+        with mock.patch.object(media_scanner, 'generate_thumbnail', wraps=media_scanner.generate_thumbnail) as mock_generate:
+            media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        # Thumbnails are made while each image is open for its metadata.
+        mock_generate.assert_not_called()
+        data_img1 = db_utils.get_media_file_by_sha(self.db_path, self.hash_img1)
+        self.assertEqual(data_img1['width'], 600)
+        self._assert_thumbnail_properties(self.thumbnail_dir_path, data_img1['thumbnail_file'], self.file_img1, self.hash_img1)
+        with Image.open(os.path.join(self.thumbnail_dir_path, data_img1['thumbnail_file'])) as thumb_img:
+            self.assertEqual(thumb_img.size, (256, 171))
+
     def test_rescan_no_changes(self):
         media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False) # Initial scan
         initial_db_state = db_utils.get_all_media_files(self.db_path)
@@ -255,6 +301,58 @@ class TestMediaScannerWithDB(unittest.TestCase):
         self.assertEqual(new_db_entry['thumbnail_file'], relative_new_thumb_path)
         self._assert_thumbnail_properties(self.thumbnail_dir_path, relative_new_thumb_path, new_img_path, new_img_hash)
 
+    def test_rescan_prune_unchanged_dirs(self):
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        initial_db_state = db_utils.get_all_media_files(self.db_path)
+        self.assertIn("subdir", db_utils.get_dir_index(self.db_path))
+
+        # Nothing changed: the unchanged subdir is served from the cache.
+        with mock.patch('media_server.media_scanner.os.scandir', wraps=os.scandir) as mock_scandir:
+            media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True, prune_unchanged_dirs=True)
+        self.assertNotIn(self.subdir, [c.args[0] for c in mock_scandir.call_args_list])
+        self.assertEqual(db_utils.get_all_media_files(self.db_path), initial_db_state)
+
+        # Adding a file bumps the subdir's mtime, so it is listed again.
+        new_img_path = create_dummy_file(self.subdir, "new_image.gif", image_details={'size': (50, 70), 'format': 'GIF'})
+        os.utime(self.subdir, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True, prune_unchanged_dirs=True)
+        self.assertIn(calculate_sha256_file(new_img_path), db_utils.get_all_media_files(self.db_path))
+
+    def test_rescan_changed_dirs_picks_up_in_place_edits(self):
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        subdir_mtime_ns = os.stat(self.subdir).st_mtime_ns
+
+        # Rewrite a file without touching its directory's mtime.
+        create_dummy_file(self.subdir, "image2.png", mtime=self.time_img2 + 100,
+                          image_details={'size': (40, 40), 'format': 'PNG'})
+        os.utime(self.subdir, ns=(subdir_mtime_ns, subdir_mtime_ns))
+        new_hash = calculate_sha256_file(self.file_img2_subdir)
+
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True, prune_unchanged_dirs=True)
+        self.assertNotIn(new_hash, db_utils.get_all_media_files(self.db_path))
+
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True,
+                                     prune_unchanged_dirs=True, changed_dirs=["subdir"])
+        self.assertIn(new_hash, db_utils.get_all_media_files(self.db_path))
+
+    def test_scan_media_entries_walks_nested_dirs(self):
+        deep_dir = os.path.join(self.test_dir, "a", "b", "c")
+        os.makedirs(deep_dir)
+        open(os.path.join(deep_dir, "deep.jpg"), "wb").close()
+        open(os.path.join(deep_dir, "notes.txt"), "wb").close()
+
+        entries, dir_mtimes = media_scanner._scan_media_entries(self.test_dir)
+        self.assertIn(os.path.join("a", "b", "c", "deep.jpg"), entries)
+        self.assertIn(os.path.join("subdir", "image2.png"), entries)
+        self.assertNotIn(os.path.join("a", "b", "c", "notes.txt"), entries)
+        self.assertTrue({"", "a", os.path.join("a", "b"), os.path.join("a", "b", "c")} <= set(dir_mtimes))
+
+    @unittest.skipUnless(hasattr(os, "posix_fadvise"), "posix_fadvise is not available")
+    def test_drop_page_cache_advises_dontneed(self):
+        with mock.patch.object(os, "posix_fadvise") as mock_fadvise:
+            media_scanner.drop_page_cache(self.file_img1)
+        mock_fadvise.assert_called_once_with(mock.ANY, 0, 0, os.POSIX_FADV_DONTNEED)
+
     def test_rescan_remove_image_file(self):
         media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False) # Initial scan
         count_before = len(db_utils.get_all_media_files(self.db_path))
@@ -273,6 +371,55 @@ class TestMediaScannerWithDB(unittest.TestCase):
         self.assertNotIn(self.hash_img1, rescan_db_state)
         self.assertFalse(os.path.exists(full_thumb_path_img1), "Thumbnail of deleted file should be removed.")
 
+    def test_rescan_moved_image_file(self):
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        moved_path = os.path.join(self.subdir, "moved.jpg")
+        os.rename(self.file_img1, moved_path)
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
+
+        db_entry = db_utils.get_media_file_by_sha(self.db_path, self.hash_img1)
+        self.assertEqual(db_entry['file_path'], os.path.join("subdir", "moved.jpg"))
+        self._assert_thumbnail_properties(self.thumbnail_dir_path, db_entry['thumbnail_file'], moved_path, self.hash_img1)
+
+    def test_cleanup_orphaned_thumbnails(self):
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        orphan_subdir = os.path.join(self.thumbnail_dir_path, "zz")
+        os.makedirs(orphan_subdir)
+        orphan = create_dummy_file(orphan_subdir, "orphan" + media_scanner.THUMBNAIL_EXTENSION)
+        flat_orphan = create_dummy_file(self.thumbnail_dir_path, "flat" + media_scanner.THUMBNAIL_EXTENSION)
+        kept_thumb = os.path.join(self.thumbnail_dir_path, self.hash_img1[:2], self.hash_img1 + media_scanner.THUMBNAIL_EXTENSION)
+
+        media_scanner._cleanup_orphaned_thumbnails(self.db_path, self.thumbnail_dir_path)
+
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(flat_orphan))
+        self.assertFalse(os.path.isdir(orphan_subdir), "Emptied prefix dir should be removed.")
+        self.assertTrue(os.path.exists(kept_thumb))
+
+    def test_cleanup_keeps_thumbnails_of_uploads_during_scan(self):
+        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
+        finished_sha, pending_sha = "ab" * 32, "cd" * 32
+        replace_dir_index = db_utils.replace_dir_index
+
+        def upload_during_scan(db_path, dir_mtimes):
+            replace_dir_index(db_path, dir_mtimes)
+            # One upload has finished; the other has its basic row and is
+            # writing its thumbnail.
+            for sha, thumbnail_file in ((finished_sha, True), (pending_sha, None)):
+                thumb_abs, thumb_rel = media_scanner._thumbnail_paths(self.thumbnail_dir_path, sha)
+                os.makedirs(os.path.dirname(thumb_abs), exist_ok=True)
+                create_dummy_file(os.path.dirname(thumb_abs), os.path.basename(thumb_abs))
+                db_utils.add_or_update_media_file(self.db_path, {
+                    'sha256_hex': sha, 'filename': sha, 'file_path': os.path.join("uploads", sha),
+                    'last_modified': 1.0, 'thumbnail_file': thumb_rel if thumbnail_file else None,
+                })
+
+        with mock.patch.object(db_utils, 'replace_dir_index', side_effect=upload_during_scan):
+            media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
+
+        for sha in (finished_sha, pending_sha):
+            self.assertTrue(os.path.exists(media_scanner._thumbnail_paths(self.thumbnail_dir_path, sha)[0]))
+
     def test_rescan_modify_image_mtime_only(self):
         """Test mtime change, SHA same, DB entry updated."""
         media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
@@ -284,12 +431,17 @@ class TestMediaScannerWithDB(unittest.TestCase):
         new_mtime = time.time() + 200
         os.utime(self.file_img1, (new_mtime, new_mtime))
 
-        media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
+        with mock.patch('PIL.Image.open', wraps=Image.open) as mock_open:
+            media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
+        # Same content: metadata and thumbnail come from the existing row.
+        mock_open.assert_not_called()
 
         db_entry_after = db_utils.get_media_file_by_sha(self.db_path, self.hash_img1)
         self.assertIsNotNone(db_entry_after)
         self.assertAlmostEqual(db_entry_after['last_modified'], new_mtime, places=5)
         self.assertNotAlmostEqual(db_entry_after['last_modified'], original_last_modified, places=5)
+        self.assertEqual(db_entry_after['width'], db_entry_before['width'])
+        self.assertEqual(db_entry_after['thumbnail_file'], db_entry_before['thumbnail_file'])
 
 
     # ... (Keep other tests like HEIC, subdir, generate_thumbnail, permissions, self-healing, adapting them for DB)
@@ -316,35 +468,41 @@ class TestMediaScannerWithDB(unittest.TestCase):
         settings.tagging_model = "Resnet"
         settings_manager.write_settings(settings)
 
-        with mock.patch('media_server.image_classifier.ImageClassifier.classify_image') as mock_classify:
-            mock_classify.return_value = [("tag1", 0.9)]
+        with mock.patch('media_server.image_classifier.ImageClassifier.classify_images') as mock_classify:
+            mock_classify.side_effect = lambda paths: [[("tag1", 0.9)] for _ in paths]
             media_scanner.scan_directory(self.test_dir, self.db_path, rescan=False)
 
             # 2. Verify initial state
             db_entry = db_utils.get_media_file_by_sha(self.db_path, self.hash_img1)
             self.assertEqual(db_entry['tagging_model'], "Resnet")
             self.assertEqual(db_entry['tags'], '[["tag1", 0.9]]')
-            self.assertEqual(mock_classify.call_count, 5) # 5 images
+            # All 5 images are classified in a single batched call.
+            mock_classify.assert_called_once()
+            self.assertEqual(len(mock_classify.call_args.args[0]), 5)
 
         # 3. Change settings to Mobilenet
         settings.tagging_model = "Mobilenet"
         settings_manager.write_settings(settings)
 
-        with mock.patch('media_server.image_classifier.ImageClassifier.classify_image') as mock_classify:
-            mock_classify.return_value = [("tag2", 0.8)]
+        with mock.patch('media_server.image_classifier.ImageClassifier.classify_images') as mock_classify, \
+                mock.patch.object(media_scanner, 'get_file_hash', wraps=media_scanner.get_file_hash) as mock_hash:
+            mock_classify.side_effect = lambda paths: [[("tag2", 0.8)] for _ in paths]
             media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
 
             # 4. Verify updated state
             db_entry = db_utils.get_media_file_by_sha(self.db_path, self.hash_img1)
             self.assertEqual(db_entry['tagging_model'], "Mobilenet")
             self.assertEqual(db_entry['tags'], '[["tag2", 0.8]]')
-            self.assertEqual(mock_classify.call_count, 5)
+            self.assertEqual(len(mock_classify.call_args.args[0]), 5)
+            # Unchanged files are retagged without being hashed again.
+            mock_hash.assert_not_called()
+            self.assertEqual(db_entry['width'], 600)
 
         # 5. Change settings to Off
         settings.tagging_model = "Off"
         settings_manager.write_settings(settings)
 
-        with mock.patch('media_server.image_classifier.ImageClassifier.classify_image') as mock_classify:
+        with mock.patch('media_server.image_classifier.ImageClassifier.classify_images') as mock_classify:
             media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
 
             # 6. Verify tags are not changed
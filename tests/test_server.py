@@ -1,3 +1,4 @@
+import atexit
 import unittest
 import os
 import shutil
@@ -6,9 +7,11 @@ import json
 import time
 from unittest import mock
 import io
+import gzip
 import hashlib
 from datetime import datetime
 import threading
+import sqlite3
 
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -80,6 +83,7 @@ class TestServerFlaskWithDB(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         db_utils.close_db_connection()
+        db_utils.close_idle_connections()
         if os.path.exists(cls.db_path):
             os.remove(cls.db_path)
         shutil.rmtree(cls.test_dir)
@@ -101,10 +105,154 @@ class TestServerFlaskWithDB(unittest.TestCase):
         self.assertIn(self.img1_sha256, returned_data)
         self.assertIn(self.vid1_sha256, returned_data)
 
+    def test_list_endpoint_paginated(self):
+        response = self.client.get('/list?limit=1')
+        self.assertEqual(response.status_code, 200)
+        first_page = response.json
+        self.assertEqual(len(first_page), 1)
+        self.assertIn('X-Next-Page', response.headers)
+
+        response = self.client.get('/list?' + response.headers['X-Next-Page'])
+        self.assertEqual(response.status_code, 200)
+        second_page = response.json
+        self.assertEqual(len(second_page), 1)
+        self.assertEqual(set(first_page) | set(second_page), {self.img1_sha256, self.vid1_sha256})
+
+        response = self.client.get('/list?' + response.headers['X-Next-Page'])
+        self.assertEqual(response.json, {})
+        self.assertNotIn('X-Next-Page', response.headers)
+
+    def test_list_endpoint_default_json_provider(self):
+        from flask.json.provider import DefaultJSONProvider
+        with mock.patch.object(flask_app, 'json', DefaultJSONProvider(flask_app)):
+            response = self.client.get('/list')
+        self.assertEqual(set(response.json), {self.img1_sha256, self.vid1_sha256})
+
+    def test_list_endpoint_gzip(self):
+        response = self.client.get('/list', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        returned_data = json.loads(gzip.decompress(response.data))
+        self.assertEqual(set(returned_data), {self.img1_sha256, self.vid1_sha256})
+        self.assertEqual(returned_data, self.client.get('/list').json)
+
+    def test_list_endpoint_reuses_cached_payload(self):
+        first = self.client.get('/list').data
+        with mock.patch.object(db_utils, 'iter_all_media_files') as mock_iter:
+            second = self.client.get('/list').data
+        mock_iter.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_list_endpoint_ignores_unrelated_query_for_cache(self):
+        with mock.patch.object(db_utils, 'iter_all_media_files', wraps=db_utils.iter_all_media_files) as mock_iter:
+            with_query = self.client.get('/list?x=1')
+            plain = self.client.get('/list')
+            self.client.get('/list?x=1')
+        self.assertLessEqual(mock_iter.call_count, 1)
+        self.assertEqual(with_query.data, plain.data)
+        self.assertEqual(with_query.headers['ETag'], plain.headers['ETag'])
+
+    def test_list_endpoint_does_not_cache_partial_reads(self):
+        get_db_connection = db_utils.get_db_connection
+
+        class FailingCursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+                self.batches = 0
+
+            def fetchmany(self, size):
+                self.batches += 1
+                if self.batches > 1:
+                    raise sqlite3.OperationalError("disk I/O error")
+                return self.cursor.fetchmany(size)
+
+        class FailingConnection:
+            def __init__(self, conn):
+                self.conn = conn
+
+            def execute(self, *args):
+                return FailingCursor(self.conn.execute(*args))
+
+        with mock.patch.object(media_server_module, '_list_cache', None), \
+                mock.patch.object(db_utils, 'get_db_connection',
+                                  lambda db_path: FailingConnection(get_db_connection(db_path))):
+            response = self.client.get('/list')
+            self.assertEqual(response.status_code, 500)
+            self.assertIsNone(media_server_module._list_cache)
+
+    def test_list_endpoint_etag(self):
+        response = self.client.get('/list')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get('/list', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        response = self.client.get('/list?limit=1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_signature_changes_on_every_write(self):
+        original_width = db_utils.get_media_file_by_sha(self.db_path, self.img1_sha256)['width']
+        # Writes within the filesystem's timestamp granularity that reuse WAL
+        # frames leave the files' size and mtime unchanged.
+        db_stat = os.stat(self.db_path)
+        etags = []
+        try:
+            for width in (1, 2):
+                db_utils.update_media_file_fields(self.db_path, self.img1_sha256, {'width': width})
+                with mock.patch.object(media_server_module.os, 'stat', return_value=db_stat):
+                    etags.append(media_server_module._db_signature(self.db_path))
+        finally:
+            db_utils.update_media_file_fields(self.db_path, self.img1_sha256, {'width': original_width})
+        self.assertNotEqual(etags[0], etags[1])
+
+    def test_list_endpoint_invalid_pagination(self):
+        self.assertEqual(self.client.get('/list?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/list?limit=abc').status_code, 400)
+        self.assertEqual(self.client.get('/list?limit=10&after_ts=1.0').status_code, 400)
+
     def test_get_thumbnail_success(self):
         response = self.client.get(f'/thumbnail/{self.img1_sha256}')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content_type, 'image/png')
+        cache_control = response.cache_control
+        self.assertTrue(cache_control.public)
+        self.assertTrue(cache_control.immutable)
+        self.assertEqual(cache_control.max_age, 365 * 24 * 60 * 60)
+
+    def test_get_thumbnail_skips_db_lookup(self):
+        with mock.patch.object(db_utils, 'get_media_file_by_sha') as mock_lookup:
+            response = self.client.get(f'/thumbnail/{self.img1_sha256}')
+        self.assertEqual(response.status_code, 200)
+        mock_lookup.assert_not_called()
+
+    def test_get_thumbnail_memory_cache(self):
+        sha = 'cd' * 32
+        thumb_path, _ = media_scanner._thumbnail_paths(flask_app.config['THUMBNAIL_DIR'], sha)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        with open(thumb_path, 'wb') as f:
+            f.write(b'fake png')
+
+        flask_app.config['THUMBNAIL_CACHE_BYTES'] = 1 << 20
+        try:
+            self.assertEqual(self.client.get(f'/thumbnail/{sha}').data, b'fake png')
+            os.remove(thumb_path)
+            response = self.client.get(f'/thumbnail/{sha}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, b'fake png')
+            self.assertEqual(response.headers['ETag'], f'"{sha}"')
+
+            media_server_module.clear_thumbnail_cache()
+            self.assertEqual(self.client.get(f'/thumbnail/{sha}').status_code, 404)
+        finally:
+            del flask_app.config['THUMBNAIL_CACHE_BYTES']
+            media_server_module.clear_thumbnail_cache()
+
+    def test_get_thumbnail_invalid_sha(self):
+        self.assertEqual(self.client.get('/thumbnail/' + 'g' * 64).status_code, 400)
+        self.assertEqual(self.client.get('/thumbnail/' + 'a' * 63).status_code, 400)
+        self.assertEqual(self.client.get('/image/' + 'a' * 65).status_code, 400)
 
     def test_get_thumbnail_not_found_for_video(self):
         response = self.client.get(f'/thumbnail/{self.vid1_sha256}')
@@ -134,10 +282,14 @@ class TestServerFlaskWithDB(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         json_response = response.json
         self.assertEqual(json_response['sha256'], img_sha256)
+        self.assertTrue(json_response['thumbnail_pending'])
+        self.assertEqual((json_response['width'], json_response['height']), (60, 30))
 
+        media_server_module.wait_for_pending_uploads()
         db_entry = db_utils.get_media_file_by_sha(self.db_path, img_sha256)
         self.assertIsNotNone(db_entry)
         self.assertEqual(db_entry['filename'], image_name)
+        self.assertIsNotNone(db_entry['thumbnail_file'])
 
         # Verify file saved
         today_str = datetime.now().strftime('%Y%m%d')
@@ -154,6 +306,139 @@ class TestServerFlaskWithDB(unittest.TestCase):
         if os.path.exists(thumb_subdir) and not os.listdir(thumb_subdir):
             os.rmdir(thumb_subdir)
 
+    def test_put_image_duplicate_leaves_no_partial_file(self):
+        with open(self.img1_path, "rb") as f:
+            content_bytes = f.read()
+
+        with mock.patch.object(media_scanner, 'save_stream_with_hash') as mock_save:
+            response = self.client.put(
+                '/image/duplicate.jpg',
+                data={'file': (io.BytesIO(content_bytes), 'duplicate.jpg')},
+                content_type='multipart/form-data'
+            )
+        mock_save.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['sha256'], self.img1_sha256)
+
+        # The size probe finds the duplicate before anything is written.
+        today_str = datetime.now().strftime('%Y%m%d')
+        upload_dir = os.path.join(self.test_dir, "uploads", today_str)
+        self.assertEqual(os.listdir(upload_dir) if os.path.isdir(upload_dir) else [], [])
+
+    def test_put_image_same_size_different_content(self):
+        with open(self.img1_path, "rb") as f:
+            content_bytes = bytearray(f.read())
+        content_bytes[-3] ^= 0xFF  # Same size as img1, different hash.
+        sha256 = hashlib.sha256(content_bytes).hexdigest()
+
+        response = self.client.put(
+            '/image/same_size.jpg',
+            data={'file': (io.BytesIO(bytes(content_bytes)), 'same_size.jpg')},
+            content_type='multipart/form-data'
+        )
+        media_server_module.wait_for_pending_uploads()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['sha256'], sha256)
+
+        today_str = datetime.now().strftime('%Y%m%d')
+        saved_path = os.path.join(self.test_dir, "uploads", today_str, "same_size.jpg")
+        with open(saved_path, "rb") as f:
+            self.assertEqual(f.read(), bytes(content_bytes))
+        os.remove(saved_path)
+        db_entry = db_utils.get_media_file_by_sha(self.db_path, sha256)
+        db_utils.delete_media_file_by_sha(self.db_path, sha256)
+        if db_entry['thumbnail_file']:
+            os.remove(os.path.join(flask_app.config['THUMBNAIL_DIR'], db_entry['thumbnail_file']))
+
+    def test_put_image_raw_body(self):
+        image_name = "raw_upload.png"
+        img_data, img_content_bytes, img_sha256 = self._create_dummy_image_bytes(text_content=image_name)
+
+        response = self.client.put(f'/image/{image_name}', data=img_content_bytes, content_type='image/png')
+        media_server_module.wait_for_pending_uploads()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['sha256'], img_sha256)
+
+        db_entry = db_utils.get_media_file_by_sha(self.db_path, img_sha256)
+        self.assertEqual(db_entry['original_filename'], image_name)
+        saved_path = os.path.join(self.test_dir, db_entry['file_path'])
+        with open(saved_path, 'rb') as f:
+            self.assertEqual(f.read(), img_content_bytes)
+        os.remove(saved_path)
+        db_utils.delete_media_file_by_sha(self.db_path, img_sha256)
+        os.remove(os.path.join(flask_app.config['THUMBNAIL_DIR'], db_entry['thumbnail_file']))
+
+    def test_put_video_drops_page_cache_without_thumbnail(self):
+        video_bytes = b'not really an mp4'
+        video_sha256 = hashlib.sha256(video_bytes).hexdigest()
+        with mock.patch.object(media_scanner, 'drop_page_cache') as mock_drop:
+            response = self.client.put('/image/clip.mp4', data=video_bytes, content_type='video/mp4')
+            media_server_module.wait_for_pending_uploads()
+        self.assertEqual(response.status_code, 201)
+
+        db_entry = db_utils.get_media_file_by_sha(self.db_path, video_sha256)
+        self.assertIsNone(db_entry['thumbnail_file'])
+        saved_path = os.path.join(self.test_dir, db_entry['file_path'])
+        mock_drop.assert_called_once_with(saved_path)
+        os.remove(saved_path)
+        db_utils.delete_media_file_by_sha(self.db_path, video_sha256)
+
+    def test_put_large_video_sparse_hash_matches_scan(self):
+        chunk = media_scanner.SPARSE_HASH_CHUNK
+        video_bytes = b'h' * chunk + b'middle' * 10 + b't' * chunk
+        with mock.patch.object(media_scanner, 'SPARSE_VIDEO_HASH', True), \
+                mock.patch.object(media_scanner, 'SPARSE_HASH_MIN_SIZE', chunk):
+            response = self.client.put('/image/large.mp4', data=video_bytes, content_type='video/mp4')
+            media_server_module.wait_for_pending_uploads()
+            self.assertEqual(response.status_code, 201)
+            upload_sha = response.json['sha256']
+            self.assertEqual(upload_sha, media_scanner.get_bytes_hash(video_bytes, 'video/mp4')[0])
+            saved_path = os.path.join(self.test_dir, db_utils.get_media_file_by_sha(self.db_path, upload_sha)['file_path'])
+
+            # Forget the upload and let the scanner hash the same file.
+            db_utils.delete_media_file_by_sha(self.db_path, upload_sha)
+            media_scanner.scan_directory(self.test_dir, self.db_path, rescan=True)
+
+        scanned_entry = db_utils.get_media_file_by_sha(self.db_path, upload_sha)
+        self.assertIsNotNone(scanned_entry)
+        self.assertEqual(os.path.join(self.test_dir, scanned_entry['file_path']), saved_path)
+        os.remove(saved_path)
+        db_utils.delete_media_file_by_sha(self.db_path, upload_sha)
+
+    def test_put_image_too_large(self):
+        flask_app.config['MAX_CONTENT_LENGTH'] = 10
+        try:
+            response = self.client.put('/image/big.png', data=b'x' * 100, content_type='image/png')
+        finally:
+            flask_app.config['MAX_CONTENT_LENGTH'] = None
+        self.assertEqual(response.status_code, 413)
+
+    def test_put_image_name_collision(self):
+        today_str = datetime.now().strftime('%Y%m%d')
+        upload_dir = os.path.join(self.test_dir, "uploads", today_str)
+        saved_names = []
+        for color in ('blue', 'green'):
+            img_byte_arr = io.BytesIO()
+            Image.new('RGB', (20, 20), color=color).save(img_byte_arr, format='PNG')
+            img_byte_arr.seek(0)
+            response = self.client.put(
+                '/image/collide.png',
+                data={'file': (img_byte_arr, 'collide.png')},
+                content_type='multipart/form-data'
+            )
+            self.assertEqual(response.status_code, 201)
+            saved_names.append(response.json['filename'])
+        media_server_module.wait_for_pending_uploads()
+        self.assertEqual(saved_names, ['collide.png', 'collide_1.png'])
+
+        for name in saved_names:
+            path = os.path.join(upload_dir, name)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+            sha256 = media_scanner.get_file_sha256(path)
+            db_entry = db_utils.get_media_file_by_sha(self.db_path, sha256)
+            os.remove(path)
+            db_utils.delete_media_file_by_sha(self.db_path, sha256)
+            os.remove(os.path.join(flask_app.config['THUMBNAIL_DIR'], db_entry['thumbnail_file']))
 
     def test_get_image_success(self):
         # This test relies on img1_path from setUpClass
@@ -163,6 +448,65 @@ class TestServerFlaskWithDB(unittest.TestCase):
             expected_content = f.read()
         self.assertEqual(response.data, expected_content)
 
+    def test_get_image_uses_server_file_wrapper(self):
+        from werkzeug.wsgi import FileWrapper
+        file_wrapper = mock.Mock(side_effect=FileWrapper)
+        response = self.client.get(
+            f'/image/{self.img1_sha256}',
+            environ_overrides={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(response.status_code, 200)
+        file_wrapper.assert_called_once()
+        self.assertEqual(response.content_length, os.path.getsize(self.img1_path))
+        response.close()
+
+    def test_media_conditional_get(self):
+        for url in (f'/image/{self.img1_sha256}', f'/thumbnail/{self.img1_sha256}'):
+            response = self.client.get(url)
+            self.assertEqual(response.headers['ETag'], f'"{self.img1_sha256}"')
+            response.close()
+
+            response = self.client.get(url, headers={'If-None-Match': f'"{self.img1_sha256}"'})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+
+        flask_app.config['X_ACCEL_REDIRECT_PREFIX'] = '/_protected/'
+        try:
+            response = self.client.get(
+                f'/image/{self.img1_sha256}', headers={'If-None-Match': f'"{self.img1_sha256}"'})
+        finally:
+            del flask_app.config['X_ACCEL_REDIRECT_PREFIX']
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_image_rejects_path_outside_storage(self):
+        sha = 'ab' * 32
+        db_utils.add_or_update_media_file(self.db_path, {
+            'sha256_hex': sha, 'filename': 'escape.jpg', 'file_path': '../escape.jpg',
+            'last_modified': time.time(), 'mime_type': 'image/jpeg'})
+        try:
+            response = self.client.get(f'/image/{sha}')
+        finally:
+            db_utils.delete_media_file_by_sha(self.db_path, sha)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_image_x_accel_redirect(self):
+        flask_app.config['X_ACCEL_REDIRECT_PREFIX'] = '/_protected/'
+        try:
+            response = self.client.get(f'/image/{self.img1_sha256}')
+            thumb_response = self.client.get(f'/thumbnail/{self.img1_sha256}')
+        finally:
+            del flask_app.config['X_ACCEL_REDIRECT_PREFIX']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/_protected/image1.jpg')
+        self.assertEqual(response.content_type, 'image/jpeg')
+        db_entry = db_utils.get_media_file_by_sha(self.db_path, self.img1_sha256)
+        self.assertEqual(
+            thumb_response.headers['X-Accel-Redirect'],
+            f"/_protected/{media_scanner.THUMBNAIL_DIR_NAME}/{db_entry['thumbnail_file']}",
+        )
+        self.assertEqual(thumb_response.content_type, 'image/png')
+
     def test_get_settings(self):
         response = self.client.get('/api/settings')
         self.assertEqual(response.status_code, 200)
@@ -229,6 +573,17 @@ class TestServerFlaskWithDB(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json), 1)
 
+        # The last second of the end date is included, the next midnight is not.
+        db_utils.update_media_file_fields(self.db_path, self.vid1_sha256, {
+            'original_creation_date': datetime(2023, 1, 20, 23, 59, 59, 500000).timestamp()})
+        self.assertEqual(len(self.client.get('/list/daterange/2023-01-20/2023-01-20').json), 1)
+        db_utils.update_media_file_fields(self.db_path, self.vid1_sha256, {
+            'original_creation_date': datetime(2023, 1, 21).timestamp()})
+        self.assertEqual(len(self.client.get('/list/daterange/2023-01-20/2023-01-20').json), 0)
+
+        response = self.client.get('/list/daterange/2023-01-20/2023-01-15')
+        self.assertEqual(response.status_code, 400)
+
     def test_list_media_by_location_success(self):
         # Update a record to have a location
         db_utils.update_media_file_fields(self.db_path, self.img1_sha256, {'city': 'TestCity', 'country': 'TestCountry'})
@@ -324,6 +679,157 @@ class TestServerBackgroundScan(unittest.TestCase):
         media_server_module.scanner_wakeup_event.set() # Wake up the thread to allow it to exit
         scanner_thread.join(timeout=1)
 
+    @mock.patch('media_server.server.media_scanner.scan_directory')
+    def test_requested_rescan_runs_when_interval_disabled(self, mock_scan_directory):
+        self.settings_manager.write_settings(settings_utils.Settings(rescan_interval=0))
+        scanned = threading.Event()
+        mock_scan_directory.side_effect = lambda *args, **kwargs: scanned.set()
+        # Set once the scanner goes back to sleep after the requested scan.
+        idle_after_scan = threading.Event()
+        real_wait = media_server_module.scanner_wakeup_event.wait
+        def wait_side_effect(timeout=None):
+            if scanned.is_set():
+                idle_after_scan.set()
+            return real_wait(timeout)
+
+        with mock.patch.object(media_server_module.scanner_wakeup_event, 'wait',
+                               side_effect=wait_side_effect):
+            scanner_thread = threading.Thread(
+                target=media_server_module.background_scanner_task,
+                args=(flask_app.app_context(), self.settings_manager),
+                daemon=True
+            )
+            scanner_thread.start()
+            media_server_module.request_rescan()
+
+            self.assertTrue(idle_after_scan.wait(timeout=5))
+        mock_scan_directory.assert_called()
+        self.assertFalse(media_server_module.rescan_requested_event.is_set())
+
+
+    def test_shortened_interval_reschedules_next_scan(self):
+        self.settings_manager.write_settings(settings_utils.Settings(rescan_interval=3600))
+        scanner_thread = threading.Thread(
+            target=media_server_module.background_scanner_task,
+            args=(flask_app.app_context(), self.settings_manager),
+            daemon=True
+        )
+        with mock.patch('media_server.server.media_scanner.scan_directory') as mock_scan_directory:
+            scans = threading.Semaphore(0)
+            mock_scan_directory.side_effect = lambda *args, **kwargs: scans.release()
+            scanner_thread.start()
+            self.assertTrue(scans.acquire(timeout=5))
+
+            self.settings_manager.write_settings(settings_utils.Settings(rescan_interval=1))
+            media_server_module.scanner_wakeup_event.set()
+            try:
+                self.assertTrue(scans.acquire(timeout=5))
+            finally:
+                media_server_module.stop_background_scanner()
+                scanner_thread.join(timeout=5)
+                media_server_module.scanner_stop_event.clear()
+                media_server_module.scanner_wakeup_event.clear()
+
+    def test_background_initial_scan(self):
+        self.settings_manager.write_settings(settings_utils.Settings(rescan_interval=0))
+        scanner_thread = threading.Thread(
+            target=media_server_module.background_scanner_task,
+            args=(flask_app.app_context(), self.settings_manager, True),
+            daemon=True
+        )
+        with mock.patch('media_server.server.media_scanner.scan_directory') as mock_scan_directory:
+            scanned = threading.Event()
+            mock_scan_directory.side_effect = lambda *args, **kwargs: scanned.set()
+            scanner_thread.start()
+            try:
+                self.assertTrue(scanned.wait(timeout=5))
+            finally:
+                media_server_module.stop_background_scanner()
+                scanner_thread.join(timeout=5)
+                media_server_module.scanner_stop_event.clear()
+                media_server_module.scanner_wakeup_event.clear()
+        mock_scan_directory.assert_called_once_with(self.test_dir, self.db_path, rescan=False)
+
+    def test_stop_background_scanner(self):
+        self.settings_manager.write_settings(settings_utils.Settings(rescan_interval=3600))
+        scanner_thread = threading.Thread(
+            target=media_server_module.background_scanner_task,
+            args=(flask_app.app_context(), self.settings_manager),
+            daemon=True
+        )
+        with mock.patch('media_server.server.media_scanner.scan_directory') as mock_scan_directory:
+            scanned = threading.Event()
+            mock_scan_directory.side_effect = lambda *args, **kwargs: scanned.set()
+            scanner_thread.start()
+            self.assertTrue(scanned.wait(timeout=5))
+            media_server_module.stop_background_scanner()
+            try:
+                scanner_thread.join(timeout=5)
+            finally:
+                media_server_module.scanner_stop_event.clear()
+                media_server_module.scanner_wakeup_event.clear()
+        self.assertFalse(scanner_thread.is_alive())
+
+    def test_rescan_requests_merge_changed_dirs(self):
+        media_server_module.request_rescan({'/media/a'})
+        media_server_module.request_rescan({'/media/b'})
+        self.assertEqual(media_server_module._take_rescan_request(),
+                         (True, {'/media/a', '/media/b'}))
+
+        # A full rescan request wins over any changed directories.
+        media_server_module.request_rescan({'/media/a'})
+        media_server_module.request_rescan()
+        media_server_module.request_rescan({'/media/b'})
+        self.assertEqual(media_server_module._take_rescan_request(), (True, None))
+        self.assertEqual(media_server_module._take_rescan_request(), (False, set()))
+
+
+class TestServe(unittest.TestCase):
+
+    def test_auto_prefers_waitress(self):
+        mock_waitress = mock.Mock()
+        with mock.patch.object(media_server_module, 'waitress', mock_waitress), \
+                mock.patch.object(flask_app, 'run') as mock_run:
+            media_server_module.serve('auto', 8123, 4)
+        mock_waitress.serve.assert_called_once_with(
+            flask_app, host='0.0.0.0', port=8123, threads=4)
+        mock_run.assert_not_called()
+
+    def test_auto_falls_back_to_flask(self):
+        with mock.patch.object(media_server_module, 'waitress', None), \
+                mock.patch.object(flask_app, 'run') as mock_run:
+            media_server_module.serve('auto', 8123, 4)
+        mock_run.assert_called_once()
+        self.assertEqual(mock_run.call_args.kwargs['port'], 8123)
+
+
+class TestLogQueue(unittest.TestCase):
+
+    def test_records_are_emitted_by_listener_thread(self):
+        import logging as python_logging
+        emitted = []
+
+        class RecordingHandler(python_logging.Handler):
+            def emit(self, record):
+                emitted.append((record.getMessage(), threading.current_thread()))
+
+        handler = RecordingHandler()
+        root_logger = python_logging.getLogger()
+        saved_handlers = root_logger.handlers[:]
+        root_logger.addHandler(handler)
+        try:
+            with mock.patch.object(media_server_module.logging, 'get_absl_handler',
+                                   return_value=handler):
+                listener = media_server_module._log_through_queue()
+            self.assertNotIn(handler, root_logger.handlers)
+            python_logging.getLogger('photobackup.test').warning('queued')
+            listener.stop()
+            atexit.unregister(listener.stop)
+        finally:
+            root_logger.handlers[:] = saved_handlers
+        self.assertEqual(emitted[0][0], 'queued')
+        self.assertIsNot(emitted[0][1], threading.current_thread())
+
 
 if __name__ == '__main__':
     unittest.main()
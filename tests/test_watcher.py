@@ -0,0 +1,51 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import sys
+
+# Add project root to sys.path to allow direct import of media_server
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from media_server import watcher
+
+
+@unittest.skipUnless(watcher.is_available(), "inotify_simple is not installed")
+class TestStorageWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix="watcher_test_")
+        self.changed = threading.Event()
+        self.changed_dirs = []
+        self.storage_watcher = watcher.StorageWatcher(
+            self.test_dir, self._on_change, debounce_seconds=0.1)
+        self.storage_watcher.start()
+
+    def _on_change(self, changed_dirs):
+        self.changed_dirs.append(changed_dirs)
+        self.changed.set()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_new_media_file_in_new_subdirectory(self):
+        subdir = os.path.join(self.test_dir, 'album')
+        os.mkdir(subdir)
+        self.assertTrue(self.changed.wait(timeout=5))
+        self.assertEqual(self.changed_dirs.pop(), {self.test_dir, subdir})
+        self.changed.clear()
+
+        with open(os.path.join(subdir, 'photo.jpg'), 'wb') as f:
+            f.write(b'not really a jpeg')
+        self.assertTrue(self.changed.wait(timeout=5))
+        self.assertEqual(self.changed_dirs.pop(), {subdir})
+
+    def test_ignores_non_media_files(self):
+        with open(os.path.join(self.test_dir, 'notes.txt'), 'w') as f:
+            f.write('hello')
+        self.assertFalse(self.changed.wait(timeout=0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()